@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless bulk lookups: geocode and fetch weather for many locations and save
+the results, e.g. to warm the caches or backfill records from cron.
+
+Input is CSV (with a header: location,start_date,end_date) or JSON lines
+with the same keys. Dates are optional and default to today.
+
+    python batch.py locations.csv
+    cat locations.jsonl | python batch.py --format jsonl -
+
+For large fleets, --processes N shards the list across N worker processes.
+Each worker geocodes, fetches and decodes with its own HTTP session, and
+all of them draw on this process's request budgets; this process stays the
+only writer to the database and inserts their results in batches.
+
+    python batch.py --processes 8 --concurrency 8 fleet.csv
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import weatherapp
+
+
+def read_jobs(stream, format_type):
+    if format_type == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # Reported by prepare_job like any other bad row
+                    row = ValueError("invalid JSON")
+                yield line_no, row
+    else:
+        for line_no, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_no, row
+
+def prepare_job(line_no, row):
+    if isinstance(row, ValueError):
+        return None, f"line {line_no}: {row}"
+    if not isinstance(row, dict):
+        return None, f"line {line_no}: expected an object"
+
+    location = str(row.get('location') or '').strip()
+    start = str(row.get('start_date') or '').strip() or datetime.now().strftime('%Y-%m-%d')
+    end = str(row.get('end_date') or '').strip() or start
+
+    if not location:
+        return None, f"line {line_no}: missing location"
+
+    dates_ok, date_msg = weatherapp.check_dates(start, end)
+    if not dates_ok:
+        return None, f"line {line_no}: {date_msg}"
+
+    return (line_no, location, start, end), None
+
+def run_job(job, fetch_executor):
+    line_no, location, start, end = job
+    # Batch output has no forecast days, so only record the forecast
+    result = weatherapp.search_weather(location, fetch_executor, priority=weatherapp.PRIORITY_BULK,
+                                       forecast_days=False)
+    if result['error']:
+        return None, f"line {line_no}: {location}: {result['error']}"
+
+    weather = result['weather']
+    record = (result['place_name'], result['lat'], result['lon'], start, end,
+              weather.temp, weather.feels_like, weather.humidity,
+              weather.description, weather.wind)
+    return record, None
+
+def run_batch(rows, concurrency=4, batch_size=100, log=sys.stderr):
+    stats = {'processed': 0, 'saved': 0, 'failed': 0, 'failures': []}
+    pending_records = []
+    start_time = time.perf_counter()
+
+    def fail(message):
+        stats['failed'] += 1
+        stats['failures'].append(message)
+        print(message, file=log)
+
+    def flush():
+        if pending_records:
+            weatherapp.save_many(pending_records)
+            stats['saved'] += len(pending_records)
+            pending_records.clear()
+
+    def collect(done):
+        for future in done:
+            stats['processed'] += 1
+            try:
+                record, error = future.result()
+            except Exception as e:
+                record, error = None, str(e)
+
+            if error:
+                fail(error)
+            else:
+                pending_records.append(record)
+                if len(pending_records) >= batch_size:
+                    flush()
+
+    # Whatever was collected is saved even if reading the input fails
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as job_pool, \
+                ThreadPoolExecutor(max_workers=concurrency * 2) as fetch_pool:
+            in_flight = set()
+            try:
+                for line_no, row in rows:
+                    job, error = prepare_job(line_no, row)
+                    if error:
+                        stats['processed'] += 1
+                        fail(error)
+                        continue
+
+                    in_flight.add(job_pool.submit(run_job, job, fetch_pool))
+                    if len(in_flight) >= concurrency * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+            finally:
+                done, _ = wait(in_flight)
+                collect(done)
+    finally:
+        flush()
+
+    stats['elapsed'] = time.perf_counter() - start_time
+    stats['rate'] = stats['processed'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    return stats
+
+# Jobs go to the worker processes in chunks of up to JOB_CHUNK to keep the
+# pickling/pipe overhead per location small
+JOB_CHUNK = 50
+
+def job_chunk_size(queued, processes):
+    # Full chunks while plenty is queued; smaller ones as the list runs out,
+    # so the tail is spread over every worker instead of landing on one
+    return max(1, min(JOB_CHUNK, -(-queued // (processes * 2))))
+
+class SharedTokenBucket(weatherapp.TokenBucket):
+    # A TokenBucket kept in shared memory, so every worker process draws on
+    # the one budget instead of a full bucket of its own: Nominatim's one
+    # request per second holds for the whole run, not per process. Made in
+    # the parent and handed to the workers as they are spawned.
+    def __init__(self, ctx, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        # tokens, updated, paused_until; time.monotonic() is system-wide
+        self._state = ctx.Array('d', [capacity, time.monotonic(), 0.0])
+    
+    def _load(self):
+        self.tokens, self.updated, self.paused_until = self._state[:]
+    
+    def _store(self):
+        self._state[:] = [self.tokens, self.updated, self.paused_until]
+    
+    def wait_time(self):
+        with self._state.get_lock():
+            self._load()
+            wait = weatherapp.TokenBucket.wait_time(self)
+            self._store()
+        return wait
+    
+    def take(self):
+        with self._state.get_lock():
+            self._load()
+            weatherapp.TokenBucket.take(self)
+            self._store()
+    
+    def try_take(self):
+        # One lock around both steps, or two workers could take the same token
+        with self._state.get_lock():
+            self._load()
+            wait = weatherapp.TokenBucket.wait_time(self)
+            if wait == 0:
+                weatherapp.TokenBucket.take(self)
+            self._store()
+        return wait
+    
+    def pause(self, seconds):
+        with self._state.get_lock():
+            self._load()
+            weatherapp.TokenBucket.pause(self, seconds)
+            self._store()
+
+def worker_settings(ctx):
+    # Everything a freshly spawned worker needs to reach the same services
+    # and caches as this process, plus request budgets shared by all workers
+    geocode = weatherapp.geocode_cache
+    responses = weatherapp.response_cache
+    return {
+        'api_key': weatherapp.API_KEY,
+        'api_base': weatherapp.API_BASE,
+        'history_api_base': weatherapp.HISTORY_API_BASE,
+        'nominatim': (weatherapp.NOMINATIM_DOMAIN, weatherapp.NOMINATIM_SCHEME),
+        'buckets': {provider: SharedTokenBucket(ctx, rate, capacity)
+                    for provider, (rate, capacity) in weatherapp.scheduler.limits().items()},
+        'geocode_cache': (geocode.path, geocode.ttl, geocode.max_entries, geocode.grid),
+        'response_cache': (responses.path, responses.grid, responses.fresh, responses.stale)
+    }
+
+def configure_worker(settings):
+    weatherapp.API_KEY = settings['api_key']
+    weatherapp.API_BASE = settings['api_base']
+    weatherapp.HISTORY_API_BASE = settings['history_api_base']
+    weatherapp.configure_geolocator(*settings['nominatim'])
+    for provider, bucket in settings['buckets'].items():
+        weatherapp.scheduler.set_bucket(provider, bucket)
+    weatherapp.geocode_cache = weatherapp.GeocodeCache(*settings['geocode_cache'])
+    weatherapp.response_cache = weatherapp.ResponseCache(*settings['response_cache'])
+
+def process_worker(jobs, results, settings, concurrency, batch_size):
+    configure_worker(settings)
+    
+    # Parsed forecasts come back with the records instead of being written
+    # here, so the parent stays the only writer to the database
+    forecasts = []
+    weatherapp.set_forecast_recorder(
+        lambda lat, lon, columns, place_name=None, fetched=None:
+        forecasts.append((lat, lon, columns, place_name, fetched)))
+    records = []
+    failures = []
+    
+    def send():
+        if records or failures or forecasts:
+            sent = forecasts[:]
+            del forecasts[:len(sent)]
+            results.put((records[:], failures[:], sent))
+            records.clear()
+            failures.clear()
+    
+    def collect(done):
+        for future in done:
+            try:
+                record, error = future.result()
+            except Exception as e:
+                record, error = None, str(e)
+            
+            if error:
+                failures.append(error)
+            else:
+                records.append(record)
+        
+        if len(records) + len(failures) >= batch_size:
+            send()
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as job_pool, \
+            ThreadPoolExecutor(max_workers=concurrency * 2) as fetch_pool:
+        in_flight = set()
+        for chunk in iter(jobs.get, None):
+            for job in chunk:
+                in_flight.add(job_pool.submit(run_job, job, fetch_pool))
+                if len(in_flight) >= concurrency * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+        
+        done, _ = wait(in_flight)
+        collect(done)
+    
+    send()
+    results.put(None)
+
+def run_batch_processes(rows, processes=None, concurrency=4, batch_size=100, log=sys.stderr):
+    processes = processes or os.cpu_count() or 1
+    stats = {'processed': 0, 'saved': 0, 'failed': 0, 'failures': [], 'processes': processes}
+    pending_records = []
+    pending_forecasts = []
+    start_time = time.perf_counter()
+    
+    def fail(message):
+        stats['failed'] += 1
+        stats['failures'].append(message)
+        print(message, file=log)
+    
+    def flush():
+        if pending_records:
+            weatherapp.save_many(pending_records)
+            stats['saved'] += len(pending_records)
+            pending_records.clear()
+        for lat, lon, columns, place_name, fetched in pending_forecasts:
+            try:
+                weatherapp.record_forecast(lat, lon, columns, place_name, fetched)
+            except sqlite3.Error:
+                pass
+        pending_forecasts.clear()
+    
+    # spawn, not fork: this process already runs the scheduler and writer
+    # threads, which a forked child would inherit without their threads
+    ctx = multiprocessing.get_context('spawn')
+    jobs = ctx.Queue(maxsize=processes * 4)
+    results = ctx.Queue()
+    settings = worker_settings(ctx)
+    workers = [ctx.Process(target=process_worker, args=(jobs, results, settings, concurrency, batch_size),
+                           daemon=True)
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    
+    invalid = []
+    
+    def feed():
+        # Reads ahead so the chunk size can follow how much is left
+        queued = deque()
+        read_ahead = JOB_CHUNK * processes * 2
+        for line_no, row in rows:
+            job, error = prepare_job(line_no, row)
+            if error:
+                invalid.append(error)
+                continue
+            queued.append(job)
+            if len(queued) >= read_ahead:
+                jobs.put([queued.popleft() for _ in range(JOB_CHUNK)])
+        while queued:
+            size = min(len(queued), job_chunk_size(len(queued), processes))
+            jobs.put([queued.popleft() for _ in range(size)])
+        for _ in workers:
+            jobs.put(None)
+    
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    
+    try:
+        finished = 0
+        while finished < len(workers):
+            try:
+                message = results.get(timeout=1)
+            except queue.Empty:
+                if any(worker.exitcode not in (None, 0) for worker in workers):
+                    raise RuntimeError("a bulk worker process exited unexpectedly")
+                continue
+            
+            if message is None:
+                finished += 1
+                continue
+            
+            records, failures, forecasts = message
+            stats['processed'] += len(records) + len(failures)
+            for error in failures:
+                fail(error)
+            pending_records.extend(records)
+            pending_forecasts.extend(forecasts)
+            if len(pending_records) >= batch_size:
+                flush()
+        
+        feeder.join()
+        flush()
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+    
+    stats['processed'] += len(invalid)
+    for error in invalid:
+        fail(error)
+    
+    stats['elapsed'] = time.perf_counter() - start_time
+    stats['rate'] = stats['processed'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk weather lookups without the GUI")
+    parser.add_argument('input', help="CSV or JSONL file, or - for stdin")
+    parser.add_argument('--format', choices=('csv', 'jsonl'),
+                        help="input format (default: from the file extension, csv for stdin)")
+    parser.add_argument('--concurrency', type=int, default=4, help="lookups in flight (default: 4)")
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help="rows per insert transaction (default: 100)")
+    parser.add_argument('--processes', type=int, default=0,
+                        help="worker processes for large lists (default: 0, threads only)")
+    parser.add_argument('--db', default=weatherapp.DB_name,
+                        help="database file; the caches live beside it")
+    args = parser.parse_args(argv)
+
+    format_type = args.format
+    if format_type is None:
+        format_type = 'jsonl' if args.input.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+    weatherapp.use_database(args.db, caches=True)
+    weatherapp.setup_database()
+
+    if args.processes:
+        run = lambda jobs: run_batch_processes(jobs, args.processes, args.concurrency, args.batch_size)
+    else:
+        run = lambda jobs: run_batch(jobs, args.concurrency, args.batch_size)
+    
+    if args.input == '-':
+        stats = run(read_jobs(sys.stdin, format_type))
+    else:
+        with open(args.input, newline='') as f:
+            stats = run(read_jobs(f, format_type))
+
+    print(f"processed {stats['processed']} rows in {stats['elapsed']:.2f} s "
+          f"({stats['rate']:.1f} rows/s): {stats['saved']} saved, {stats['failed']} failed",
+          file=sys.stderr)
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for weatherapp. Everything runs against the local stub API
+(stub_server.py) and temporary databases, never the live services or
+weather_data.db.
+
+    python bench.py                                   # every benchmark
+    python bench.py search bulk --latency 0.05 --json results.json
+    python bench.py export table --rows 1000,100000,1000000
+
+A summary is printed to stderr and the results are written as JSON (to
+stdout unless --json is given) so runs can be compared for regressions.
+"""
+
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import requests
+
+import weatherapp
+from stub_server import StubServer
+
+
+def log(message):
+    print(message, file=sys.stderr)
+
+def summarize(samples):
+    # Latency samples in seconds -> milliseconds summary
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+    return {
+        'count': len(samples),
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': samples[-1] * 1000
+    }
+
+def make_stub(config):
+    stub = StubServer(config.latency, config.jitter, config.error_rate, payload_dir=config.payloads)
+    stub.start()
+    return stub
+
+def use_stub(stub, tmp, cache=False):
+    weatherapp.API_KEY = 'bench'
+    weatherapp.API_BASE = stub.url
+    weatherapp.HISTORY_API_BASE = stub.url + '/onecall'
+    weatherapp.configure_geolocator(stub.domain, 'http')
+    weatherapp.configure_session()
+    # The stub has no quota, so measure the code rather than the token buckets
+    weatherapp.scheduler.set_limit('nominatim', 100000, 1000)
+    weatherapp.scheduler.set_limit('openweathermap', 100000, 1000)
+
+    if cache:
+        weatherapp.response_cache = weatherapp.ResponseCache(os.path.join(tmp, 'responses.db'))
+        weatherapp.geocode_cache = weatherapp.GeocodeCache(os.path.join(tmp, 'geocode.db'))
+    else:
+        no_time = {'weather': 0, 'forecast': 0}
+        weatherapp.response_cache = weatherapp.ResponseCache(os.path.join(tmp, 'responses.db'),
+                                                             fresh=no_time, stale=no_time)
+        weatherapp.geocode_cache = weatherapp.GeocodeCache(os.path.join(tmp, 'geocode.db'), ttl=-1)
+
+def fill_database(path, n):
+    weatherapp.use_database(path)
+    weatherapp.setup_database()
+    with weatherapp.db.transaction() as conn:
+        conn.executemany('''INSERT INTO searches (location, lat, lon, start_date, end_date, temp,
+                            feels_like, humidity, weather_desc, wind_speed, timestamp)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                         ((f'City {i} <&>', 40.7, -74.0, '2025-01-01', '2025-01-05', 18.2, 17.6, 55,
+                           'clear sky', 3.4, f'2025-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}')
+                          for i in range(n)))
+    weatherapp.db.close()
+
+
+def run_http_benchmark(config, n=200):
+    stub = make_stub(config)
+    params = {'lat': 40.7, 'lon': -74.0, 'appid': 'x', 'units': 'metric'}
+    try:
+        # What get_weather/get_forecast used to do: two fresh connections per search
+        start = time.perf_counter()
+        for _ in range(n):
+            requests.get(f"{stub.url}/weather", params=params, timeout=10).json()
+            requests.get(f"{stub.url}/forecast", params=params, timeout=10).json()
+        bare = (time.perf_counter() - start) / n
+
+        weatherapp.API_BASE = stub.url
+        weatherapp.configure_session()
+        start = time.perf_counter()
+        for _ in range(n):
+            weatherapp.fetch_api('weather', 40.7, -74.0)
+            weatherapp.fetch_api('forecast', 40.7, -74.0)
+        pooled = (time.perf_counter() - start) / n
+    finally:
+        stub.stop()
+
+    log(f"HTTP per search ({n} searches, weather + forecast):")
+    log(f"  bare requests.get : {bare * 1000:.2f} ms")
+    log(f"  pooled session    : {pooled * 1000:.2f} ms")
+    return {'searches': n, 'bare_ms': bare * 1000, 'pooled_ms': pooled * 1000}
+
+
+def run_search_benchmark(config):
+    # End-to-end search_weather: geocode, then weather + forecast in parallel
+    stub = make_stub(config)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            weatherapp.use_database(os.path.join(tmp, 'search.db'))
+            weatherapp.setup_database()
+            executor = weatherapp.ThreadPoolExecutor(max_workers=4)
+
+            for label, cache in (('cold', False), ('warm', True)):
+                use_stub(stub, tmp, cache)
+                weatherapp.timings.enabled = True
+                weatherapp.timings.reset()
+                samples = []
+                errors = 0
+                for i in range(config.searches):
+                    # Warm runs repeat ten places so nearly every lookup is a hit
+                    location = f'City {i % 10}' if cache else f'City {i}'
+                    start = time.perf_counter()
+                    result = weatherapp.search_weather(location, executor)
+                    samples.append(time.perf_counter() - start)
+                    errors += bool(result['error'])
+                results[label] = dict(summarize(samples), errors=errors,
+                                      spans=weatherapp.timings.stats())
+                log(f"Search ({label} caches, {config.searches} searches): "
+                    f"p50 {results[label]['p50_ms']:.1f} ms, p95 {results[label]['p95_ms']:.1f} ms, "
+                    f"{errors} errors")
+
+            executor.shutdown()
+            weatherapp.search_writer.flush()
+            weatherapp.db.close()
+    finally:
+        stub.stop()
+    return results
+
+
+class StubProcess:
+    # The stub in its own interpreter, so it doesn't compete for the GIL with
+    # the process being measured
+    def __init__(self, config):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_server.py')
+        args = [sys.executable, script, '--port', '0', '--latency', str(config.latency),
+                '--jitter', str(config.jitter), '--error-rate', str(config.error_rate)]
+        if config.payloads:
+            args += ['--payloads', config.payloads]
+        self.proc = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+        self.url = self.proc.stdout.readline().split()[-1]
+        self.domain = self.url.split('//', 1)[1]
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait()
+
+def run_bulk_benchmark(config):
+    import batch
+
+    stub = StubProcess(config)
+    results = {'locations': config.locations}
+    runs = [('threads', 0)] + [(f'processes_{n}', n) for n in config.processes]
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            use_stub(stub, tmp, cache=False)
+            for label, processes in runs:
+                weatherapp.use_database(os.path.join(tmp, f'bulk_{label}.db'))
+                weatherapp.setup_database()
+
+                rows = ((i + 2, {'location': f'Town {i}'}) for i in range(config.locations))
+                if processes:
+                    stats = batch.run_batch_processes(rows, processes, concurrency=8, batch_size=100,
+                                                      log=io.StringIO())
+                else:
+                    stats = batch.run_batch(rows, concurrency=8, batch_size=100, log=io.StringIO())
+                weatherapp.db.close()
+
+                results[label] = {'rows_per_s': stats['rate'], 'elapsed_s': stats['elapsed'],
+                                  'saved': stats['saved'], 'failed': stats['failed']}
+                line = (f"Bulk ({config.locations} locations, {label.replace('_', ' ')}, concurrency 8): "
+                        f"{stats['rate']:.1f} rows/s, {stats['failed']} failed")
+                if processes and 'processes_1' in results:
+                    results[label]['speedup'] = stats['rate'] / results['processes_1']['rows_per_s']
+                    line += f", {results[label]['speedup']:.2f}x one process"
+                log(line)
+    finally:
+        stub.stop()
+    return results
+
+
+def run_db_benchmark(config, n=2000):
+    with tempfile.TemporaryDirectory() as tmp:
+        # The old helpers: a fresh connection and a rollback-journal commit per call
+        path = os.path.join(tmp, 'old.db')
+        conn = sqlite3.connect(path)
+        weatherapp.migrate_create_searches(conn)
+        conn.commit()
+        conn.close()
+
+        start = time.perf_counter()
+        for i in range(n):
+            conn = sqlite3.connect(path)
+            conn.execute(weatherapp.INSERT_SEARCH,
+                         (f'City {i}', 40.7, -74.0, '2025-01-01', '2025-01-05', 18.2, 17.6, 55,
+                          'clear sky', 3.4, '2025-01-01 12:00:00'))
+            conn.commit()
+            conn.close()
+        old_inserts = n / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(20):
+            conn = sqlite3.connect(path)
+            conn.execute('SELECT * FROM searches ORDER BY timestamp DESC').fetchall()
+            conn.close()
+        old_reads = 20 / (time.perf_counter() - start)
+
+        weatherapp.use_database(os.path.join(tmp, 'new.db'))
+        weatherapp.setup_database()
+
+        start = time.perf_counter()
+        futures = [weatherapp.save_to_db_async(f'City {i}', 40.7, -74.0, '2025-01-01', '2025-01-05',
+                                               18.2, 17.6, 55, 'clear sky', 3.4)
+                   for i in range(n)]
+        for future in futures:
+            future.result()
+        new_inserts = n / (time.perf_counter() - start)
+
+        # One caller waiting on each row, as the GUI and the API server do
+        start = time.perf_counter()
+        for i in range(n):
+            weatherapp.save_to_db(f'City {i}', 40.7, -74.0, '2025-01-01', '2025-01-05',
+                                  18.2, 17.6, 55, 'clear sky', 3.4)
+        blocking_inserts = n / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(20):
+            weatherapp.get_all_searches()
+        new_reads = 20 / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(200):
+            weatherapp.get_searches_page()
+        page_reads = 200 / (time.perf_counter() - start)
+        weatherapp.db.close()
+
+    log(f"SQLite ({n} inserts, then 20 full reads):")
+    log(f"  connection per call : {old_inserts:8.0f} inserts/s  {old_reads:6.1f} reads/s")
+    log(f"  write-behind queue  : {new_inserts:8.0f} inserts/s  {new_reads:6.1f} reads/s  "
+        f"{page_reads:6.0f} pages/s")
+    log(f"  blocking save_to_db : {blocking_inserts:8.0f} inserts/s")
+    return {'rows': n,
+            'per_call': {'inserts_per_s': old_inserts, 'full_reads_per_s': old_reads},
+            'shared': {'inserts_per_s': new_inserts, 'blocking_inserts_per_s': blocking_inserts,
+                       'full_reads_per_s': new_reads, 'page_reads_per_s': page_reads}}
+
+
+def legacy_export(format_type, filename):
+    # The exporters as they were: fetchall(), then build the whole document
+    rows = weatherapp.db.query('SELECT * FROM searches ORDER BY timestamp DESC')
+    if format_type == 'json':
+        with open(filename, 'w') as f:
+            json.dump([weatherapp.row_to_dict(row) for row in rows], f, indent=2)
+    elif format_type == 'csv':
+        with open(filename, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+    else:
+        doc = ''
+        for row in rows:
+            doc += f'{row[0]} {row[1]} {row[4]} {row[5]} {row[6]} {row[8]} {row[9]} {row[11]}\n'
+        with open(filename, 'w') as f:
+            f.write(doc)
+
+def export_child(db_path, format_type, filename, streaming, results):
+    weatherapp.use_database(db_path)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if streaming:
+        weatherapp.export_searches(format_type, filename)
+    else:
+        legacy_export(format_type, filename)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((elapsed, (peak - baseline) / 1024))
+
+def run_export_benchmark(config):
+    # Each export runs in a fresh process so the peak RSS belongs to that export
+    ctx = multiprocessing.get_context('spawn')
+    modes = ('streaming', 'legacy') if config.legacy else ('streaming',)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in config.rows:
+            db_path = os.path.join(tmp, f'export_{n}.db')
+            fill_database(db_path, n)
+            results[n] = {}
+
+            log(f"Export of {n} rows (time, peak RSS growth):")
+            for format_type in weatherapp.EXPORTERS:
+                line = f"  {format_type:8}"
+                for mode in modes:
+                    queue = ctx.Queue()
+                    proc = ctx.Process(target=export_child, args=(
+                        db_path, format_type, os.path.join(tmp, f'out.{format_type}'),
+                        mode == 'streaming', queue))
+                    proc.start()
+                    elapsed, peak_mb = queue.get()
+                    proc.join()
+
+                    results[n].setdefault(format_type, {})[mode] = {
+                        'seconds': elapsed, 'rows_per_s': n / elapsed if elapsed else 0.0,
+                        'peak_rss_mb': peak_mb}
+                    line += f"  {mode}: {elapsed:6.2f} s {peak_mb:8.1f} MB"
+                log(line)
+            os.remove(db_path)
+    return results
+
+
+def measure_rows(build):
+    tracemalloc.start()
+    rows = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return len(rows), size
+
+def run_record_benchmark(config):
+    n = max(config.rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'records.db')
+        fill_database(db_path, n)
+        weatherapp.use_database(db_path)
+
+        sql = f'SELECT {weatherapp.SEARCH_COLUMNS} FROM searches'
+        variants = [
+            ('tuples', lambda: weatherapp.db.query(sql)),
+            ('tuples + JSON dicts', lambda: [weatherapp.row_to_dict(row) for row in weatherapp.db.query(sql)]),
+            ('SearchRecord', lambda: weatherapp.db.query(sql, factory=weatherapp.search_record_factory))
+        ]
+
+        log(f"Memory for {n} loaded rows (including field values):")
+        for label, build in variants:
+            start = time.perf_counter()
+            count, size = measure_rows(build)
+            elapsed = time.perf_counter() - start
+            results[label] = {'bytes_per_row': size / count, 'seconds': elapsed}
+            log(f"  {label:20} {size / count:7.1f} bytes/row  {elapsed:6.2f} s")
+
+        weatherapp.db.close()
+    return {'rows': n, 'variants': results}
+
+
+def run_tk_until(root, ready, timeout=60):
+    # WeatherApp's background threads hand results to Tk with root.after,
+    # which only works while mainloop runs, so wait inside it
+    deadline = time.monotonic() + timeout
+    def poll():
+        if ready() or time.monotonic() > deadline:
+            root.quit()
+        else:
+            root.after(2, poll)
+    root.after(0, poll)
+    root.mainloop()
+    if not ready():
+        raise RuntimeError("timed out waiting for the window")
+
+def run_table_benchmark(config):
+    try:
+        weatherapp.load_tkinter()
+        root = weatherapp.tk.Tk()
+        root.withdraw()
+    except Exception as e:
+        log(f"Table: skipped ({e})")
+        return {'skipped': str(e)}
+
+    stub = make_stub(config)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            use_stub(stub, tmp, cache=True)
+            for n in config.rows:
+                fill_database(os.path.join(tmp, f'table_{n}.db'), n)
+                weatherapp.use_database(os.path.join(tmp, f'table_{n}.db'))
+
+                window = weatherapp.tk.Toplevel(root)
+                app = weatherapp.WeatherApp(window)
+                # Time the table, not the first load running in the background
+                run_tk_until(root, lambda: app.db_ready.is_set() and not app.table_page_pending)
+                app.refresher.stop()
+
+                start = time.perf_counter()
+                app.refresh_table()
+                root.update_idletasks()
+                refresh = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for _ in range(10):
+                    app.load_table_page()
+                root.update_idletasks()
+                page = (time.perf_counter() - start) / 10
+
+                window.destroy()
+                weatherapp.db.close()
+                results[n] = {'refresh_ms': refresh * 1000, 'next_page_ms': page * 1000}
+                log(f"Table ({n} rows): refresh_table {refresh * 1000:.1f} ms, "
+                    f"next page {page * 1000:.1f} ms")
+    finally:
+        stub.stop()
+        root.destroy()
+    return results
+
+
+# Run in a fresh interpreter so nothing is already imported or cached
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import weatherapp
+imported = time.perf_counter() - start
+result = {'import_s': imported,
+          'network_loaded': 'requests' in sys.modules or 'geopy' in sys.modules}
+try:
+    weatherapp.load_tkinter()
+    root = weatherapp.tk.Tk()
+except Exception as e:
+    result['window'] = 'skipped: %s' % e
+else:
+    app = weatherapp.WeatherApp(root)
+    # The history arrives from a worker thread through root.after, which
+    # needs mainloop running; poll from inside it
+    def painted():
+        result['paint_s'] = time.perf_counter() - start
+    def poll():
+        if 'paint_s' in result and app.db_ready.is_set() and not app.table_page_pending:
+            result['history_s'] = time.perf_counter() - start
+            result['table_rows'] = len(app.table.get_children())
+            root.quit()
+        else:
+            root.after(1, poll)
+    root.after_idle(painted)
+    root.after(0, poll)
+    root.mainloop()
+    app.refresher.stop()
+    root.destroy()
+print(json.dumps(result))
+"""
+
+def run_startup_benchmark(config, runs=5):
+    package = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package, os.environ.get('PYTHONPATH')])))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in config.rows:
+            # The app opens weather_data.db in the working directory
+            fill_database(os.path.join(tmp, weatherapp.DB_name), n)
+            samples = []
+            for _ in range(runs):
+                out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=tmp, env=env,
+                                     capture_output=True, text=True, check=True).stdout
+                samples.append(json.loads(out.splitlines()[-1]))
+
+            result = {'runs': runs, 'network_loaded': samples[0]['network_loaded']}
+            for key in ('import_s', 'paint_s', 'history_s'):
+                values = sorted(sample[key] for sample in samples if key in sample)
+                if values:
+                    result[key.replace('_s', '_ms')] = values[len(values) // 2] * 1000
+            if 'window' in samples[0]:
+                result['window'] = samples[0]['window']
+            results[n] = result
+
+            line = f"Startup ({n} rows, median of {runs}): import {result['import_ms']:.1f} ms"
+            if 'paint_ms' in result:
+                line += f", first paint {result['paint_ms']:.1f} ms, history {result['history_ms']:.1f} ms"
+            else:
+                line += f", window {result['window']}"
+            log(line)
+            os.remove(os.path.join(tmp, weatherapp.DB_name))
+    return results
+
+
+BENCHMARKS = {
+    'http': run_http_benchmark,
+    'search': run_search_benchmark,
+    'bulk': run_bulk_benchmark,
+    'db': run_db_benchmark,
+    'export': run_export_benchmark,
+    'records': run_record_benchmark,
+    'table': run_table_benchmark,
+    'startup': run_startup_benchmark
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="weatherapp benchmark suite")
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--rows', default='1000,100000,1000000',
+                        help="comma separated table sizes for export, records, table and startup")
+    parser.add_argument('--searches', type=int, default=100, help="searches in the search benchmark")
+    parser.add_argument('--locations', type=int, default=500, help="locations in the bulk benchmark")
+    parser.add_argument('--processes',
+                        help="comma separated worker process counts for the bulk benchmark "
+                             "(default: powers of two up to the CPU count)")
+    parser.add_argument('--latency', type=float, default=0.02, help="stub latency per request (s)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="std dev of the stub latency (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of stub requests that fail")
+    parser.add_argument('--payloads', help="directory of recorded <endpoint>.json responses")
+    parser.add_argument('--legacy', action='store_true', help="also time the pre-streaming exporters")
+    parser.add_argument('--json', help="write results to this file instead of stdout")
+    config = parser.parse_args(argv)
+
+    for name in config.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+    config.rows = [int(n) for n in config.rows.split(',')]
+    if config.processes:
+        config.processes = [int(n) for n in config.processes.split(',')]
+    else:
+        cpus = os.cpu_count() or 1
+        config.processes = [2 ** i for i in range(cpus.bit_length()) if 2 ** i <= cpus]
+
+    results = {}
+    for name in config.benchmarks or BENCHMARKS:
+        results[name] = BENCHMARKS[name](config)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'config': {key: value for key, value in vars(config).items() if key != 'json'},
+        'results': results
+    }
+    if config.json:
+        with open(config.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
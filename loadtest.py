@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test for the API server (server.py). Starts the stub upstreams
+(stub_server.py) and the server in their own processes against a temporary
+database, then drives the server with concurrent keep-alive clients and
+reports requests/s and latency percentiles per endpoint.
+
+    python loadtest.py                                  # 50 clients for 20 s
+    python loadtest.py --clients 200 --locations 20 --latency 0.1
+    python loadtest.py --mix search=1,history=1,export=0.05 --json load.json
+    python loadtest.py --url http://127.0.0.1:8080      # an already running server
+
+A summary is printed to stderr and the results are written as JSON (to
+stdout unless --json is given), the same way bench.py reports.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import quote, urlsplit
+
+from bench import StubProcess, log, summarize
+
+
+class ServerProcess:
+    def __init__(self, stub, db_path, workers):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+        args = [sys.executable, script, '--port', '0', '--db', db_path, '--workers', str(workers),
+                '--api-key', 'loadtest', '--api-base', stub.url,
+                '--history-api-base', stub.url + '/onecall',
+                '--nominatim', stub.domain, '--nominatim-scheme', 'http',
+                '--nominatim-rate', '100000', '--owm-per-minute', '6000000']
+        self.proc = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError("the API server failed to start")
+        self.url = line.split()[-1]
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait()
+
+async def fetch(reader, writer, host, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    body = await reader.readexactly(length)
+    return status, body
+
+def make_request(endpoint, rand, config):
+    today = datetime.now().strftime('%Y-%m-%d')
+    city = f"City {rand.randrange(config.locations)}"
+    if endpoint == 'search':
+        return f"/search?location={quote(city)}&start={today}"
+    if endpoint == 'history':
+        if rand.random() < 0.5:
+            return f"/history?limit=50&q={quote(city)}"
+        return "/history?limit=50"
+    return "/export?format=csv"
+
+async def run_client(url, config, deadline, samples, failures, seed):
+    rand = random.Random(seed)
+    parts = urlsplit(url)
+    endpoints = list(config.mix)
+    weights = [config.mix[name] for name in endpoints]
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+    try:
+        while time.monotonic() < deadline:
+            endpoint = rand.choices(endpoints, weights)[0]
+            path = make_request(endpoint, rand, config)
+            start = time.perf_counter()
+            try:
+                status, _ = await fetch(reader, writer, parts.netloc, path)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                failures[endpoint] = failures.get(endpoint, 0) + 1
+                writer.close()
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+                continue
+            samples.setdefault(endpoint, []).append(time.perf_counter() - start)
+            if status != 200:
+                failures[endpoint] = failures.get(endpoint, 0) + 1
+    finally:
+        writer.close()
+
+async def server_stats(url):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+    try:
+        _, body = await fetch(reader, writer, parts.netloc, '/stats')
+    finally:
+        writer.close()
+    return json.loads(body)
+
+async def drive(url, config):
+    samples = {}
+    failures = {}
+    start = time.perf_counter()
+    deadline = time.monotonic() + config.duration
+    await asyncio.gather(*(run_client(url, config, deadline, samples, failures, seed)
+                           for seed in range(config.clients)))
+    elapsed = time.perf_counter() - start
+    return samples, failures, elapsed, await server_stats(url)
+
+def run_load_test(config):
+    stub = server = None
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            url = config.url
+            if url is None:
+                stub = StubProcess(config)
+                server = ServerProcess(stub, os.path.join(tmp, 'load.db'), config.workers)
+                url = server.url
+            samples, failures, elapsed, stats = asyncio.run(drive(url, config))
+        finally:
+            if server is not None:
+                server.stop()
+            if stub is not None:
+                stub.stop()
+
+    total = sum(len(times) for times in samples.values())
+    results = {'requests': total, 'elapsed_s': elapsed, 'requests_per_s': total / elapsed,
+               'collapsed': stats['collapsed'], 'endpoints': {}}
+    log(f"Load test ({config.clients} clients, {config.duration:.0f} s, {config.locations} locations): "
+        f"{total} requests, {total / elapsed:.1f} req/s, {stats['collapsed']} collapsed")
+    for endpoint in config.mix:
+        times = samples.get(endpoint, [])
+        summary = summarize(times)
+        summary['failed'] = failures.get(endpoint, 0)
+        summary['requests_per_s'] = len(times) / elapsed
+        results['endpoints'][endpoint] = summary
+        if times:
+            log(f"  {endpoint:<8} {summary['requests_per_s']:8.1f} req/s  p50 {summary['p50_ms']:7.1f} ms  "
+                f"p95 {summary['p95_ms']:7.1f} ms  p99 {summary['p99_ms']:7.1f} ms  "
+                f"{summary['failed']} failed")
+    results['server'] = stats
+    return results
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ('search', 'history', 'export'):
+            raise argparse.ArgumentTypeError(f"unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for the weather API server")
+    parser.add_argument('--url', help="test this running server instead of starting one with the stub")
+    parser.add_argument('--clients', type=int, default=50, help="concurrent connections (default: 50)")
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds to run (default: 20)")
+    parser.add_argument('--locations', type=int, default=100,
+                        help="distinct places searched; fewer means more cache hits and collapsing")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('search=7,history=3'),
+                        help="endpoint weights (default: search=7,history=3)")
+    parser.add_argument('--workers', type=int, default=16, help="server lookup threads (default: 16)")
+    parser.add_argument('--latency', type=float, default=0.02, help="stub latency per request (s)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="std dev of the stub latency (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of stub requests that fail")
+    parser.add_argument('--payloads', help="directory of recorded <endpoint>.json responses")
+    parser.add_argument('--json', help="write results to this file instead of stdout")
+    config = parser.parse_args(argv)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(config).items() if key != 'json'},
+        'results': run_load_test(config)
+    }
+    if config.json:
+        with open(config.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Maintenance commands for the weather database.
+
+    python maintenance.py rebuild-rollups
+    python maintenance.py report --location "Paris, France"
+
+Old searches can be moved out of the live table into monthly gzipped JSON
+lines files, then the freed space handed back to the filesystem:
+
+    python maintenance.py retention --max-age-days 365 --max-rows 500000
+    python maintenance.py compact
+    python maintenance.py archive-export csv 2024.csv --start 2024-01-01 --end 2024-12-31
+"""
+
+import argparse
+import sys
+import time
+
+import weatherapp
+
+
+def rebuild_rollups(args):
+    start = time.perf_counter()
+    rows = weatherapp.rebuild_rollups(archive_dir=args.archive_dir)
+    print(f"rebuilt rollups from {rows} searches in {time.perf_counter() - start:.2f} s",
+          file=sys.stderr)
+    return 0
+
+def format_average(value, unit):
+    return '-' if value is None else f"{value:.1f}{unit}"
+
+def report(args):
+    if args.location:
+        summary = weatherapp.location_summary(args.location)
+        if summary is None:
+            print(f"no searches for {args.location}", file=sys.stderr)
+            return 1
+        
+        print(f"{summary.location}: {summary.searches} searches, "
+              f"avg {format_average(summary.avg_temp, '°C')}, "
+              f"humidity {format_average(summary.avg_humidity, '%')}")
+        for day in weatherapp.daily_averages(args.location, args.start, args.end):
+            print(f"  {day.day}  {day.searches:6}  {format_average(day.avg_temp, '°C'):>8}  "
+                  f"{format_average(day.avg_humidity, '%'):>7}")
+    else:
+        print("Most searched locations:")
+        for summary in weatherapp.top_locations(args.limit):
+            print(f"  {summary.searches:8}  {format_average(summary.avg_temp, '°C'):>8}  "
+                  f"{summary.location}")
+    
+    print("Humidity distribution:")
+    for bucket, searches in weatherapp.humidity_distribution(args.location).items():
+        print(f"  {bucket:3}%  {searches}")
+    return 0
+
+def retention(args):
+    if args.max_age_days is None and args.max_rows is None:
+        print("nothing to do: give --max-age-days and/or --max-rows", file=sys.stderr)
+        return 1
+    
+    start = time.perf_counter()
+    result = weatherapp.apply_retention(args.max_age_days, args.max_rows, args.archive_dir,
+                                        dry_run=args.dry_run)
+    verb = "would archive" if args.dry_run else "archived"
+    print(f"{verb} {result['archived']} searches in {time.perf_counter() - start:.2f} s"
+          + (f" into {', '.join(result['partitions'])}" if result['partitions'] else ""),
+          file=sys.stderr)
+    return 0
+
+def compact(args):
+    start = time.perf_counter()
+    if args.full and weatherapp.enable_incremental_vacuum():
+        print("switched the database to incremental auto_vacuum", file=sys.stderr)
+    
+    released = weatherapp.compact()
+    if released is None:
+        print("the database isn't in incremental auto_vacuum mode; run compact --full once",
+              file=sys.stderr)
+        return 1
+    print(f"released {released} pages in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+    return 0
+
+def archive_export(args):
+    weatherapp.export_archive(args.format, args.file, args.start, args.end, args.location,
+                              args.archive_dir)
+    return 0
+
+COMMANDS = {
+    'rebuild-rollups': rebuild_rollups,
+    'report': report,
+    'retention': retention,
+    'compact': compact,
+    'archive-export': archive_export
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Weather database maintenance")
+    parser.add_argument('--db', default=weatherapp.DB_name, help="database file; the archive lives beside it")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    rebuild_parser = commands.add_parser('rebuild-rollups',
+                                         help="recompute the rollup tables from searches and the archive")
+    rebuild_parser.add_argument('--archive-dir', help="default: archive/ beside the database")
+    
+    report_parser = commands.add_parser('report', help="print aggregates from the rollups")
+    report_parser.add_argument('--location', help="one location's daily averages")
+    report_parser.add_argument('--start', help="first day (YYYY-MM-DD) for --location")
+    report_parser.add_argument('--end', help="last day (YYYY-MM-DD) for --location")
+    report_parser.add_argument('--limit', type=int, default=10, help="locations to list (default: 10)")
+    
+    retention_parser = commands.add_parser('retention', help="archive searches past the limits")
+    retention_parser.add_argument('--max-age-days', type=int, help="keep searches newer than this")
+    retention_parser.add_argument('--max-rows', type=int, help="keep at most this many searches")
+    retention_parser.add_argument('--archive-dir', help="default: archive/ beside the database")
+    retention_parser.add_argument('--dry-run', action='store_true', help="only count what would move")
+    
+    compact_parser = commands.add_parser('compact', help="return free pages to the filesystem")
+    compact_parser.add_argument('--full', action='store_true',
+                                help="first switch an older database to incremental auto_vacuum "
+                                     "(one full VACUUM)")
+    
+    export_parser = commands.add_parser('archive-export', help="export archived searches")
+    export_parser.add_argument('format', choices=sorted(weatherapp.EXPORTERS))
+    export_parser.add_argument('file')
+    export_parser.add_argument('--start', help="first day (YYYY-MM-DD)")
+    export_parser.add_argument('--end', help="last day (YYYY-MM-DD)")
+    export_parser.add_argument('--location', help="substring of the location name")
+    export_parser.add_argument('--archive-dir', help="default: archive/ beside the database")
+    args = parser.parse_args(argv)
+    
+    weatherapp.use_database(args.db, caches=True)
+    weatherapp.setup_database()
+    return COMMANDS[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
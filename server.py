@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless HTTP/JSON API over the same lookup pipeline as the GUI, for other
+tools: geocode -> current weather + forecast -> save, plus the saved history
+and exports. It shares this process's geocode and response caches, request
+scheduler and search writer, so the database still has a single writer.
+
+    python server.py --port 8080
+    curl 'http://127.0.0.1:8080/search?location=Paris&start=2025-06-01&end=2025-06-03'
+    curl 'http://127.0.0.1:8080/history?q=par&near=Lyon&radius=500&limit=20'
+    curl -o history.csv 'http://127.0.0.1:8080/export?format=csv'
+    curl 'http://127.0.0.1:8080/stats'
+
+/search and /history answers are collapsed: identical requests arriving
+while one is still being answered wait for that one and get the same
+response (and, for /search, the same saved row) instead of running again.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import signal
+import sys
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import weatherapp
+
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error', 502: 'Bad Gateway'}
+
+EXPORT_TYPES = {'json': 'application/json', 'csv': 'text/csv', 'xml': 'application/xml',
+                'md': 'text/markdown'}
+
+MAX_HISTORY_PAGE = 1000
+DEFAULT_RADIUS_KM = 50.0
+SEND_CHUNK = 64 * 1024
+
+FileBody = namedtuple('FileBody', ['path', 'content_type'])
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def encode_json(data):
+    return json.dumps(data, separators=(',', ':'), default=str).encode()
+
+def parse_float(query, name):
+    try:
+        return float(query[name]) if query.get(name) else None
+    except ValueError:
+        raise HTTPError(400, f"{name} must be a number")
+
+
+class SingleFlight:
+    # Identical requests in flight share one task. Waiters are shielded from
+    # it, so a client hanging up doesn't cancel the others' answer.
+    def __init__(self):
+        self.started = 0
+        self.collapsed = 0
+        self._tasks = {}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def run(self, key, make):
+        task = self._tasks.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(make())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._tasks.pop(key, None)
+                                   if self._tasks.get(key) is done else None)
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
+
+
+class ApiServer:
+    def __init__(self, workers=16):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api')
+        self.fetch_pool = ThreadPoolExecutor(max_workers=workers * 2, thread_name_prefix='api-fetch')
+        self.flights = SingleFlight()
+        self.requests = 0
+        self.errors = 0
+        self.routes = {
+            '/search': self.search,
+            '/history': self.history,
+            '/export': self.export,
+            '/stats': self.stats
+        }
+
+    async def call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, functools.partial(fn, *args))
+
+    async def search(self, query):
+        location = (query.get('location') or '').strip()
+        if not location:
+            raise HTTPError(400, "missing location")
+        start = query.get('start') or datetime.now().strftime('%Y-%m-%d')
+        end = query.get('end') or start
+
+        dates_ok, date_msg = weatherapp.check_dates(start, end)
+        if not dates_ok:
+            raise HTTPError(400, date_msg)
+
+        body = await self.flights.run(('search', location.lower(), start, end),
+                                      lambda: self.call(self.run_search, location, start, end))
+        return 'application/json', body
+
+    def run_search(self, location, start, end):
+        result = weatherapp.search_weather(location, self.fetch_pool)
+        if result['error']:
+            raise HTTPError(404 if result['error'] == "Location Not Found" else 502, result['error'])
+
+        weather = result['weather']
+        saved_id = weatherapp.save_to_db(result['place_name'], result['lat'], result['lon'],
+                                         start, end, weather.temp, weather.feels_like,
+                                         weather.humidity, weather.description, weather.wind)
+        response = {
+            'id': saved_id,
+            'location': result['place_name'],
+            'lat': result['lat'],
+            'lon': result['lon'],
+            'start_date': start,
+            'end_date': end,
+            'weather': weather._asdict(),
+            'forecast': [day._asdict() for day in result['forecast'] or []],
+            'forecast_error': result['forecast_error']
+        }
+
+        # Past dates: what the weather actually was, as the GUI shows it
+        if start < datetime.now().strftime('%Y-%m-%d'):
+            report = weatherapp.backfill_history(result['lat'], result['lon'], start, end,
+                                                 result['place_name'])
+            response['history'] = [day._asdict() for day in
+                                   weatherapp.get_history(result['lat'], result['lon'], start, end)]
+            response['history_failed'] = [date for date, _ in report['failed']]
+        return encode_json(response)
+
+    async def history(self, query):
+        key = ('history',) + tuple(sorted(query.items()))
+        body = await self.flights.run(key, lambda: self.call(self.run_history, query))
+        return 'application/json', body
+
+    def run_history(self, query):
+        # Unfiltered pages are keyed on (timestamp, id), filtered ones on id;
+        # `next` is the cursor for the following page either way
+        try:
+            limit = min(int(query.get('limit') or weatherapp.PAGE_SIZE), MAX_HISTORY_PAGE)
+        except ValueError:
+            raise HTTPError(400, "limit must be an integer")
+        cursor = query.get('cursor')
+        text = query.get('q')
+        lat = parse_float(query, 'lat')
+        lon = parse_float(query, 'lon')
+        radius = parse_float(query, 'radius')
+
+        if query.get('near'):
+            loc_ok, lat, lon, place_name = weatherapp.check_location(query['near'])
+            if not loc_ok:
+                raise HTTPError(404 if place_name == "Location Not Found" else 502, place_name)
+        if lat is not None and lon is not None and radius is None:
+            radius = DEFAULT_RADIUS_KM
+
+        try:
+            if text or (lat is not None and lon is not None):
+                rows = weatherapp.find_searches(text, lat, lon, radius,
+                                                int(cursor) if cursor else None, limit)
+                next_cursor = str(rows[-1].id) if len(rows) == limit else None
+            else:
+                after = tuple(cursor.rsplit('|', 1)) if cursor else None
+                rows = weatherapp.get_searches_page((after[0], int(after[1])) if after else None, limit)
+                next_cursor = f"{rows[-1].timestamp}|{rows[-1].id}" if len(rows) == limit else None
+        except (ValueError, IndexError):
+            raise HTTPError(400, "bad cursor")
+
+        return encode_json({'searches': [weatherapp.row_to_dict(row) for row in rows], 'next': next_cursor})
+
+    async def export(self, query):
+        # Written to a temporary file by the usual exporters and streamed
+        # from there, so big histories never sit in memory
+        format_type = query.get('format', 'json')
+        if format_type not in EXPORT_TYPES:
+            raise HTTPError(400, f"format must be one of {', '.join(EXPORT_TYPES)}")
+
+        fd, path = tempfile.mkstemp(suffix='.' + format_type)
+        os.close(fd)
+        try:
+            if query.get('source') == 'archive':
+                await self.call(weatherapp.export_archive, format_type, path, query.get('start'),
+                                query.get('end'), query.get('location'))
+            else:
+                await self.call(weatherapp.export_searches, format_type, path)
+        except BaseException:
+            os.remove(path)
+            raise
+        return EXPORT_TYPES[format_type], FileBody(path, EXPORT_TYPES[format_type])
+
+    async def stats(self, query):
+        writer = weatherapp.search_writer
+        return 'application/json', encode_json({
+            'requests': self.requests,
+            'errors': self.errors,
+            'collapsed': self.flights.collapsed,
+            'in_flight': len(self.flights),
+            'scheduler': weatherapp.scheduler.stats(),
+            'writer': {'batches': writer.batches, 'rows': writer.rows},
+            'timings': weatherapp.timings.stats()
+        })
+
+    async def respond(self, method, target, writer, keep_alive):
+        self.requests += 1
+        url = urlsplit(target)
+        handler = self.routes.get(url.path.rstrip('/'))
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        try:
+            if handler is None:
+                raise HTTPError(404, f"no such endpoint: {url.path}")
+            if method not in ('GET', 'HEAD'):
+                raise HTTPError(405, f"{method} not allowed")
+            content_type, body = await handler(query)
+            status = 200
+        except HTTPError as e:
+            status, content_type, body = e.status, 'application/json', encode_json({'error': str(e)})
+        except Exception as e:
+            status, content_type, body = 500, 'application/json', encode_json({'error': str(e)})
+        if status != 200:
+            self.errors += 1
+
+        if isinstance(body, FileBody):
+            try:
+                with open(body.path, 'rb') as f:
+                    self.write_head(writer, status, content_type, os.fstat(f.fileno()).st_size, keep_alive)
+                    while method != 'HEAD':
+                        chunk = f.read(SEND_CHUNK)
+                        if not chunk:
+                            break
+                        writer.write(chunk)
+                        await writer.drain()
+            finally:
+                os.remove(body.path)
+        else:
+            self.write_head(writer, status, content_type, len(body), keep_alive)
+            if method != 'HEAD':
+                writer.write(body)
+
+    def write_head(self, writer, status, content_type, length, keep_alive):
+        writer.write((f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                      f"Content-Type: {content_type}\r\n"
+                      f"Content-Length: {length}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1'))
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                request_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ')
+                except ValueError:
+                    self.write_head(writer, 400, 'text/plain', 0, False)
+                    break
+
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+
+                # Every endpoint is a GET; a body is read and ignored
+                if headers.get('content-length'):
+                    await reader.readexactly(int(headers['content-length']))
+
+                await self.respond(method, target, writer, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.fetch_pool.shutdown(wait=True)
+
+
+async def serve(args):
+    api = ApiServer(args.workers)
+    server = await asyncio.start_server(api.handle, args.host, args.port, limit=64 * 1024)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f"Weather API listening on http://{host}:{port}", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async with server:
+        await stop.wait()
+    api.close()
+    weatherapp.search_writer.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for weather lookups and history")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help="0 picks a free port")
+    parser.add_argument('--db', default=weatherapp.DB_name,
+                        help="database file; the caches and the archive live beside it")
+    parser.add_argument('--workers', type=int, default=16, help="lookup threads (default: 16)")
+    parser.add_argument('--api-key', default=weatherapp.API_KEY, help="OpenWeatherMap API key")
+    parser.add_argument('--api-base', default=weatherapp.API_BASE)
+    parser.add_argument('--history-api-base', default=weatherapp.HISTORY_API_BASE)
+    parser.add_argument('--nominatim', default=weatherapp.NOMINATIM_DOMAIN, help="geocoder host[:port]")
+    parser.add_argument('--nominatim-scheme', default=weatherapp.NOMINATIM_SCHEME)
+    parser.add_argument('--nominatim-rate', type=float, default=weatherapp.NOMINATIM_RATE,
+                        help="geocoder requests per second")
+    parser.add_argument('--owm-per-minute', type=float, default=weatherapp.OWM_CALLS_PER_MINUTE,
+                        help="OpenWeatherMap requests per minute")
+    args = parser.parse_args(argv)
+
+    weatherapp.API_KEY = args.api_key
+    weatherapp.API_BASE = args.api_base
+    weatherapp.HISTORY_API_BASE = args.history_api_base
+    weatherapp.configure_geolocator(args.nominatim, args.nominatim_scheme)
+    weatherapp.scheduler.set_limit('nominatim', args.nominatim_rate, 1)
+    weatherapp.scheduler.set_limit('openweathermap', args.owm_per_minute / 60.0, 10)
+    # More lookups in flight than the default pool size would otherwise queue
+    # inside urllib3 waiting for a connection
+    weatherapp.configure_session(pool_size=max(weatherapp.HTTP_POOL_SIZE, args.workers))
+
+    weatherapp.use_database(args.db, caches=True)
+    weatherapp.setup_database()
+
+    asyncio.run(serve(args))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the OpenWeatherMap and Nominatim APIs, for benchmarks and
+offline runs. Serves recorded payloads (or generated ones) with configurable
+latency and injected errors.
+
+    python stub_server.py --port 8085 --latency 0.1 --error-rate 0.05
+
+Point weatherapp at it with API_BASE = "http://127.0.0.1:8085" and
+configure_geolocator("127.0.0.1:8085", "http").
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_weather_payload(lat=40.7, lon=-74.0):
+    return {
+        'coord': {'lat': lat, 'lon': lon},
+        'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky'}],
+        'main': {'temp': 18.2, 'feels_like': 17.6, 'humidity': 55, 'pressure': 1015},
+        'wind': {'speed': 3.4},
+        'timezone': -14400,
+        'dt': int(time.time())
+    }
+
+def make_forecast_payload(lat=40.7, lon=-74.0):
+    start = int(time.time()) // 10800 * 10800
+    items = []
+    for i in range(40):
+        dt = start + i * 10800
+        items.append({
+            'dt': dt,
+            'dt_txt': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(dt)),
+            'main': {'temp': 10 + (i % 8) * 1.5, 'humidity': 60 + i % 10},
+            'weather': [{'description': 'light rain' if i % 3 else 'clear sky'}],
+            'wind': {'speed': 2.0 + i % 4},
+            'rain': {'3h': 0.4} if i % 3 else {}
+        })
+    return {'cnt': 40, 'list': items, 'city': {'coord': {'lat': lat, 'lon': lon}, 'timezone': -14400}}
+
+def make_day_summary_payload(date, lat=40.7, lon=-74.0):
+    seed = sum(map(ord, date)) % 10
+    return {
+        'lat': lat, 'lon': lon, 'date': date, 'units': 'metric',
+        'temperature': {'min': 5.0 + seed, 'max': 15.0 + seed, 'afternoon': 13.0 + seed},
+        'humidity': {'afternoon': 50 + seed},
+        'precipitation': {'total': seed * 0.3},
+        'wind': {'max': {'speed': 4.0 + seed / 2}}
+    }
+
+def make_place_payload(query):
+    # A stable, made-up coordinate per query so different names geocode apart
+    seed = sum(ord(c) * (i + 1) for i, c in enumerate(query.lower()))
+    lat = (seed % 12000) / 100.0 - 60
+    lon = (seed // 12000 % 36000) / 100.0 - 180
+    return {'lat': f'{lat:.4f}', 'lon': f'{lon:.4f}', 'display_name': f'{query} (stub)'}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+
+        body = stub.payload(endpoint, query)
+        if body is None:
+            self.send_error(404)
+            return
+
+        stub.count(endpoint)
+        delay = stub.next_delay()
+        if delay:
+            time.sleep(delay)
+
+        if stub.should_fail():
+            self.send_response(stub.error_status)
+            if stub.error_status == 429:
+                self.send_header('Retry-After', '1')
+            body = json.dumps({'cod': stub.error_status, 'message': 'injected error'}).encode()
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503,
+                 payload_dir=None, host='127.0.0.1', port=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.host = host
+        self.port = port
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._recorded = {}
+        if payload_dir:
+            # Recorded responses: weather.json, forecast.json, search.json, ...
+            for name in os.listdir(payload_dir):
+                if name.endswith('.json'):
+                    with open(os.path.join(payload_dir, name), 'rb') as f:
+                        self._recorded[name[:-5]] = f.read()
+        self._weather = self._recorded.get('weather') or json.dumps(make_weather_payload()).encode()
+        self._forecast = self._recorded.get('forecast') or json.dumps(make_forecast_payload()).encode()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def domain(self):
+        return f"{self.host}:{self.port}"
+
+    def payload(self, endpoint, query):
+        if endpoint == 'weather':
+            return self._weather
+        if endpoint == 'forecast':
+            return self._forecast
+        if endpoint in self._recorded:
+            return self._recorded[endpoint]
+        if endpoint == 'day_summary':
+            return json.dumps(make_day_summary_payload(query.get('date', '2025-01-01'))).encode()
+        if endpoint == 'search':
+            return json.dumps([make_place_payload(query.get('q', ''))]).encode()
+        if endpoint == 'reverse':
+            place = make_place_payload(f"{query.get('lat')},{query.get('lon')}")
+            place.update(lat=query.get('lat'), lon=query.get('lon'))
+            return json.dumps(place).encode()
+        return None
+
+    def count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def next_delay(self):
+        if not self.jitter:
+            return self.latency
+        with self._lock:
+            return max(0.0, self._random.gauss(self.latency, self.jitter))
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenWeatherMap/Nominatim stand-in")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="std dev of the added latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument('--error-status', type=int, default=503, help="status code for injected errors")
+    parser.add_argument('--payloads', help="directory of recorded <endpoint>.json responses")
+    args = parser.parse_args(argv)
+
+    stub = StubServer(args.latency, args.jitter, args.error_rate, args.error_status,
+                      args.payloads, args.host, args.port)
+    print(f"Stub API listening on {stub.start()}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
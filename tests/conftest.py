@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import weatherapp
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # A fresh, fully migrated database (and archive directory) for the test,
+    # then back to the default
+    monkeypatch.setattr(weatherapp, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    weatherapp.use_database(str(tmp_path / 'weather_data.db'))
+    weatherapp.setup_database()
+    yield weatherapp.db
+    weatherapp.use_database(weatherapp.DB_name)
@@ -0,0 +1,24 @@
+import multiprocessing
+
+import batch
+
+
+def test_chunks_shrink_as_the_list_runs_out():
+    assert batch.job_chunk_size(10000, 4) == batch.JOB_CHUNK
+    # 100 jobs over 4 workers: no worker is handed half the list
+    assert batch.job_chunk_size(100, 4) == 13
+    assert batch.job_chunk_size(3, 4) == 1
+
+def test_shared_bucket_spends_one_budget():
+    ctx = multiprocessing.get_context('spawn')
+    bucket = batch.SharedTokenBucket(ctx, 1.0, 1)
+    assert bucket.try_take() == 0
+    assert bucket.try_take() > 0.9
+
+    # Every handle on the same shared state sees the token already spent
+    other = batch.SharedTokenBucket.__new__(batch.SharedTokenBucket)
+    other.__dict__.update(bucket.__dict__)
+    assert other.try_take() > 0.9
+
+    bucket.pause(30)
+    assert other.wait_time() > 29
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+import weatherapp
+
+
+def forecast_payload(start):
+    return {'city': {'timezone': 0},
+            'list': [{'dt': start + 3 * 3600 * i,
+                      'main': {'temp': 10.0 + i, 'humidity': 60},
+                      'wind': {'speed': 2.0},
+                      'weather': [{'description': 'clear sky'}]}
+                     for i in range(8)]}
+
+
+@pytest.fixture
+def upstream(database, tmp_path, monkeypatch):
+    # Counts upstream fetches and serves them from a cache of its own
+    fetches = []
+    start = int(time.time()) // 3600 * 3600
+
+    def fetch_api(endpoint, lat, lon, units='metric', base=None, params=None):
+        fetches.append(endpoint)
+        return forecast_payload(start)
+
+    monkeypatch.setattr(weatherapp, 'fetch_api', fetch_api)
+    monkeypatch.setattr(weatherapp, 'response_cache',
+                        weatherapp.ResponseCache(str(tmp_path / 'response_cache.db')))
+    return fetches
+
+
+def stored_points(database):
+    return database.query('SELECT valid_time, fetched FROM forecast_points ORDER BY valid_time')
+
+def test_fetch_records_forecast_once(database, upstream):
+    before = int(time.time())
+    weatherapp.api_get('forecast', 51.5, -0.12, place_name='London')
+    points = stored_points(database)
+    assert len(points) == 8
+    assert all(before <= fetched <= time.time() for _, fetched in points)
+
+    # A cache hit neither refetches nor rewrites the history
+    time.sleep(1.1)
+    weatherapp.api_get('forecast', 51.5, -0.12, place_name='London')
+    assert upstream == ['forecast']
+    assert stored_points(database) == points
+
+def test_refresh_records_forecast(database, upstream):
+    daemon = weatherapp.RefreshDaemon()
+    key = weatherapp.response_cache.make_key('forecast', 48.85, 2.35, 'metric')
+    daemon.refresh('forecast', 48.85, 2.35, key)
+    assert daemon.refreshed == 1
+    assert len(stored_points(database)) == 8
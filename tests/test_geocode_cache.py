@@ -0,0 +1,104 @@
+from collections import namedtuple
+
+import pytest
+
+import weatherapp
+
+
+Place = namedtuple('Place', ['latitude', 'longitude', 'address'])
+
+class StubGeolocator:
+    # Stands in for geopy's Nominatim and counts the lookups it is asked for
+    def __init__(self):
+        self.calls = []
+
+    def geocode(self, query, timeout=None):
+        self.calls.append(('geocode', query))
+        if query == 'Nowhere':
+            return None
+        return Place(48.8566, 2.3522, f'{query}, France')
+
+    def reverse(self, query, timeout=None):
+        self.calls.append(('reverse', query))
+        return Place(None, None, f'Near {query}')
+
+
+@pytest.fixture(autouse=True)
+def fast_scheduler(monkeypatch):
+    # The real Nominatim budget is one call a second; the stub has none
+    monkeypatch.setattr(weatherapp, 'scheduler', weatherapp.RequestScheduler(
+        {'nominatim': (1000.0, 100), 'openweathermap': (1000.0, 100)}))
+
+@pytest.fixture
+def cache(tmp_path):
+    return weatherapp.GeocodeCache(str(tmp_path / 'geocode.db'), ttl=3600, max_entries=3)
+
+@pytest.fixture
+def geolocator():
+    return StubGeolocator()
+
+
+def test_warm_hit_skips_geolocator(cache, geolocator):
+    first = weatherapp.check_location('Paris', geolocator, cache)
+    second = weatherapp.check_location('  paris ', geolocator, cache)
+
+    assert first == (True, 48.8566, 2.3522, 'Paris, France')
+    assert second == first
+    assert geolocator.calls == [('geocode', 'Paris')]
+
+def test_reverse_lookups_are_cached_on_the_grid(cache, geolocator):
+    first = weatherapp.check_location('40.71280, -74.00600', geolocator, cache)
+    second = weatherapp.check_location('40.71281, -74.00601', geolocator, cache)
+
+    assert first[0] and second[0]
+    assert second[3] == first[3]
+    assert len(geolocator.calls) == 1
+
+def test_not_found_is_not_cached(cache, geolocator):
+    assert weatherapp.check_location('Nowhere', geolocator, cache) == \
+        (False, None, None, "Location Not Found")
+    weatherapp.check_location('Nowhere', geolocator, cache)
+
+    assert len(geolocator.calls) == 2
+    assert cache.stats()['entries'] == 0
+
+def test_expired_entries_are_refetched(cache, geolocator):
+    weatherapp.check_location('Paris', geolocator, cache)
+    # Age the entry past the TTL
+    conn = cache._connect()
+    conn.execute('UPDATE geocode_cache SET created = created - ?', (cache.ttl + 1,))
+    conn.commit()
+
+    weatherapp.check_location('Paris', geolocator, cache)
+
+    assert len(geolocator.calls) == 2
+    assert cache.stats()['misses'] == 2
+
+def test_eviction_keeps_max_entries_and_drops_least_recently_used(cache):
+    for i, name in enumerate(['a', 'b', 'c']):
+        cache.put(cache.query_key(name), i, i, name)
+    conn = cache._connect()
+    conn.executemany('UPDATE geocode_cache SET last_used=? WHERE key=?',
+                     [(1.0, cache.query_key('a')), (2.0, cache.query_key('b')),
+                      (3.0, cache.query_key('c'))])
+    conn.commit()
+
+    # Touching 'a' makes 'b' the least recently used
+    assert cache.get(cache.query_key('a')) is not None
+    cache.put(cache.query_key('d'), 3, 3, 'd')
+
+    assert cache.stats()['entries'] == 3
+    assert cache.get(cache.query_key('b')) is None
+    for name in ('a', 'c', 'd'):
+        assert cache.get(cache.query_key(name)) is not None
+
+def test_hit_and_miss_counters(cache, geolocator):
+    for name in ('Paris', 'Paris', 'Lyon', 'Paris', 'Lyon'):
+        weatherapp.check_location(name, geolocator, cache)
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (3, 2, 2)
+    assert stats['hit_ratio'] == pytest.approx(0.6)
+
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'hit_ratio': 0.0, 'entries': 0}
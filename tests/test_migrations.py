@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+import weatherapp
+
+
+# The searches table exactly as the original app created it, with no
+# indexes and PRAGMA user_version left at 0
+BASELINE_SCHEMA = '''Create Table If NOT EXISTS searches
+              (id Integer PRIMARY KEY AUTOINCREMENT,
+               location TEXT,
+               lat REAL,
+               lon REAL,
+               start_date TEXT,
+               end_date TEXT,
+               temp REAL,
+               feels_like REAL,
+               humidity INTEGER,
+               weather_desc TEXT,
+               wind_speed REAL, 
+               timestamp TEXT)'''
+
+PAGE_QUERY = f'''SELECT {weatherapp.SEARCH_COLUMNS} FROM searches
+                 ORDER BY timestamp DESC, id DESC LIMIT ?'''
+
+KEYSET_QUERY = f'''SELECT {weatherapp.SEARCH_COLUMNS} FROM searches WHERE (timestamp, id) < (?, ?)
+                   ORDER BY timestamp DESC, id DESC LIMIT ?'''
+
+ROWS = [(f'City {i % 7}', 40.0 + i % 7, -70.0 - i % 7, '2025-01-01', '2025-01-02',
+         10.0 + i % 5, 9.0, 50 + i % 30, 'clear sky', 3.0,
+         f'2025-01-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00')
+        for i in range(500)]
+
+
+@pytest.fixture
+def baseline_db(tmp_path, monkeypatch):
+    path = str(tmp_path / 'weather_data.db')
+    conn = sqlite3.connect(path)
+    conn.execute(BASELINE_SCHEMA)
+    conn.executemany('''INSERT INTO searches (location, lat, lon, start_date, end_date, temp,
+                        feels_like, humidity, weather_desc, wind_speed, timestamp)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', ROWS)
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(weatherapp, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    weatherapp.use_database(path)
+    yield path
+    weatherapp.use_database(weatherapp.DB_name)
+
+
+def test_upgrade_in_place_keeps_every_row(baseline_db):
+    conn = sqlite3.connect(baseline_db)
+    before = conn.execute('SELECT * FROM searches ORDER BY id').fetchall()
+    conn.close()
+
+    weatherapp.setup_database()
+
+    after = weatherapp.db.query('SELECT * FROM searches ORDER BY id')
+    assert after == before
+    assert len(after) == len(ROWS)
+
+def test_upgrade_sets_schema_version(baseline_db):
+    assert weatherapp.get_schema_version() == 0
+
+    weatherapp.setup_database()
+    assert weatherapp.get_schema_version() == weatherapp.SCHEMA_VERSION
+    assert weatherapp.db.query('PRAGMA user_version')[0][0] == weatherapp.SCHEMA_VERSION
+
+    # Running again is a no-op
+    weatherapp.setup_database()
+    assert weatherapp.get_schema_version() == weatherapp.SCHEMA_VERSION
+
+def test_upgrade_backfills_derived_tables(baseline_db):
+    weatherapp.setup_database()
+
+    city = [row for row in ROWS if row[0] == 'City 3']
+    assert len(weatherapp.find_searches('city 3', limit=len(ROWS))) == len(city)
+    assert len(weatherapp.find_searches(lat=43.0, lon=-73.0, radius_km=1, limit=len(ROWS))) == len(city)
+    assert weatherapp.location_summary('City 3').searches == len(city)
+
+@pytest.mark.parametrize('sql, params', [(PAGE_QUERY, (200,)),
+                                         (KEYSET_QUERY, ('2025-01-15 12:00:00', 10, 200))])
+def test_history_pages_use_timestamp_index(baseline_db, sql, params):
+    weatherapp.setup_database()
+
+    plan = weatherapp.explain_query_plan(sql, params)
+    assert any('USING INDEX idx_searches_timestamp' in step for step in plan), plan
+    assert not any('TEMP B-TREE' in step for step in plan), plan
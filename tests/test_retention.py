@@ -0,0 +1,51 @@
+import weatherapp
+
+ROWS = [(f'City {i % 5}', 10.0 + i % 5, 20.0, '2024-01-01', '2024-01-02', 5.0 + i % 9, 4.0,
+         40 + i % 50, 'overcast clouds', 2.0, f'2024-{1 + i % 6:02d}-{1 + i % 28:02d} 08:00:00')
+        for i in range(300)]
+
+
+def reports():
+    return (weatherapp.top_locations(), weatherapp.location_summary('City 3'),
+            weatherapp.daily_averages('City 1'), weatherapp.humidity_distribution())
+
+def count(database, table):
+    return database.query(f'SELECT COUNT(*) FROM {table}')[0][0]
+
+
+def test_archive_round_trip(database):
+    with database.transaction() as conn:
+        conn.executemany(weatherapp.INSERT_SEARCH, ROWS)
+    before = weatherapp.get_all_searches()
+    totals = reports()
+
+    report = weatherapp.apply_retention(max_rows=100, batch_size=64, pause=0)
+    assert report['archived'] == 200
+    assert report['partitions'] == weatherapp.archived_partitions()
+
+    live = weatherapp.get_all_searches()
+    archived = list(weatherapp.iter_archived())
+    assert len(live) == 100 and len(archived) == 200
+    assert sorted(live + archived, key=lambda row: row.id) == sorted(before, key=lambda row: row.id)
+    assert all(row.timestamp < min(kept.timestamp for kept in live) for row in archived)
+
+    # Archived rows leave the search indexes but stay counted in the rollups
+    assert count(database, 'searches_fts') == count(database, 'searches_rtree') == 100
+    assert reports() == totals
+    assert weatherapp.rebuild_rollups() == 300
+    assert reports() == totals
+
+    # An ordinary delete still takes a row out of the rollups
+    weatherapp.delete_search(live[0].id)
+    assert weatherapp.location_summary(live[0].location).searches == \
+        [row.searches for row in totals[0] if row.location == live[0].location][0] - 1
+
+def test_archive_filters(database):
+    with database.transaction() as conn:
+        conn.executemany(weatherapp.INSERT_SEARCH, ROWS)
+    weatherapp.apply_retention(max_rows=0, pause=0)
+    assert count(database, 'searches') == 0
+
+    march = list(weatherapp.iter_archived('2024-03-01', '2024-03-31', 'city 2'))
+    expected = [row for row in ROWS if row[10].startswith('2024-03') and row[0] == 'City 2']
+    assert sorted(row.timestamp for row in march) == sorted(row[10] for row in expected)
@@ -0,0 +1,54 @@
+import random
+
+import weatherapp
+
+TABLES = {
+    'daily_rollups': 'location, day',
+    'location_rollups': 'location',
+    'humidity_rollups': 'location, bucket',
+}
+
+
+def snapshot(database):
+    # Sums are rounded: the triggers add and subtract one row at a time
+    tables = {}
+    for table, key in TABLES.items():
+        rows = database.query(f'SELECT * FROM {table} ORDER BY {key}')
+        tables[table] = [tuple(round(value, 6) if isinstance(value, float) else value
+                               for value in row) for row in rows]
+    return tables
+
+def random_edits(database, rand, count):
+    locations = ['London, UK', 'Paris, France', 'Tokyo, Japan', None]
+    ids = []
+    for _ in range(count):
+        action = rand.random()
+        if action < 0.5 or not ids:
+            temp = None if rand.random() < 0.1 else round(rand.uniform(-20, 40), 1)
+            humidity = None if rand.random() < 0.1 else rand.randrange(0, 101)
+            ids.append(weatherapp.save_to_db(rand.choice(locations), 51.5, -0.12, '2025-01-01',
+                                             '2025-01-02', temp, temp, humidity, 'clear sky', 3.0))
+        elif action < 0.65:
+            weatherapp.update_search(rand.choice(ids), rand.choice(locations), '2025-02-01', '2025-02-02')
+        elif action < 0.8:
+            database.execute('UPDATE searches SET temp=?, humidity=?, timestamp=? WHERE id=?',
+                             (rand.choice([None, round(rand.uniform(-20, 40), 1)]),
+                              rand.choice([None, rand.randrange(0, 101)]),
+                              f'2025-01-{rand.randrange(1, 29):02d} 12:00:00', rand.choice(ids)))
+        else:
+            search_id = ids.pop(rand.randrange(len(ids)))
+            weatherapp.delete_search(search_id)
+
+
+def test_triggers_match_rebuild(database):
+    random_edits(database, random.Random(23), 600)
+    incremental = snapshot(database)
+    assert incremental['location_rollups']
+
+    weatherapp.rebuild_rollups()
+    assert snapshot(database) == incremental
+
+def test_rollups_empty_after_deleting_everything(database):
+    random_edits(database, random.Random(5), 100)
+    database.execute('DELETE FROM searches')
+    assert snapshot(database) == {table: [] for table in TABLES}
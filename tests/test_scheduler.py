@@ -0,0 +1,57 @@
+import threading
+
+import weatherapp
+
+
+def make_scheduler(rate=20.0):
+    return weatherapp.RequestScheduler({'openweathermap': (rate, 1)}, workers=1)
+
+def recorder(order, name, release=None):
+    def fn():
+        if release is not None:
+            release.wait(5)
+        order.append(name)
+        return name
+    return fn
+
+
+def test_interactive_duplicate_moves_queued_call_ahead_of_bulk():
+    scheduler = make_scheduler()
+    order = []
+    release = threading.Event()
+    # Holds the single worker so everything below is still queued
+    blocker = scheduler.submit('openweathermap', 'blocker', recorder(order, 'blocker', release))
+
+    background = scheduler.submit('openweathermap', 'hot', recorder(order, 'hot'),
+                                  weatherapp.PRIORITY_BACKGROUND)
+    bulk = [scheduler.submit('openweathermap', f'bulk {i}', recorder(order, f'bulk {i}'),
+                             weatherapp.PRIORITY_BULK)
+            for i in range(5)]
+    interactive = scheduler.submit('openweathermap', 'hot', recorder(order, 'duplicate'),
+                                   weatherapp.PRIORITY_INTERACTIVE)
+    release.set()
+
+    assert interactive is background
+    assert interactive.result(timeout=5) == 'hot'
+    for future in [blocker] + bulk:
+        future.result(timeout=5)
+    assert order[:2] == ['blocker', 'hot']
+    assert order.count('hot') == 1 and 'duplicate' not in order
+    assert scheduler.stats()['openweathermap']['queued'] == 0
+
+def test_lower_priority_duplicate_keeps_position():
+    scheduler = make_scheduler()
+    order = []
+    release = threading.Event()
+    scheduler.submit('openweathermap', 'blocker', recorder(order, 'blocker', release))
+
+    first = scheduler.submit('openweathermap', 'a', recorder(order, 'a'), weatherapp.PRIORITY_INTERACTIVE)
+    second = scheduler.submit('openweathermap', 'b', recorder(order, 'b'), weatherapp.PRIORITY_BULK)
+    assert scheduler.submit('openweathermap', 'a', recorder(order, 'a again'),
+                            weatherapp.PRIORITY_BACKGROUND) is first
+    release.set()
+
+    first.result(timeout=5)
+    second.result(timeout=5)
+    assert order == ['blocker', 'a', 'b']
+    assert scheduler.stats()['openweathermap']['deduplicated'] == 1
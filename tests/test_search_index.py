@@ -0,0 +1,44 @@
+import weatherapp
+
+
+def save(location, lat, lon):
+    return weatherapp.save_to_db(location, lat, lon, '2025-01-01', '2025-01-02',
+                                 25.0, 27.0, 80, 'light rain', 4.0)
+
+
+def ids(rows):
+    return sorted(row.id for row in rows)
+
+def index_counts(database):
+    return [database.query(f'SELECT COUNT(*) FROM {table}')[0][0]
+            for table in ('searches', 'searches_fts', 'searches_rtree')]
+
+
+def test_distance_search_crosses_antimeridian(database):
+    east = save('Suva, Fiji', -17.7, 179.95)
+    west = save('Taveuni East, Fiji', -17.7, -179.95)
+    save('London, UK', 51.5, -0.12)
+
+    # 179.95 E and 179.95 W are about 11 km apart
+    assert ids(weatherapp.find_searches(lat=-17.7, lon=179.99, radius_km=50)) == [east, west]
+    assert ids(weatherapp.find_searches(lat=-17.7, lon=-179.99, radius_km=50)) == [east, west]
+    assert ids(weatherapp.find_searches('fiji', lat=-17.7, lon=-179.99, radius_km=50)) == [east, west]
+    assert ids(weatherapp.find_searches('suva', lat=-17.7, lon=-179.99, radius_km=50)) == [east]
+
+def test_triggers_keep_indexes_in_sync(database):
+    search_id = save('Suva, Fiji', -17.7, 179.95)
+    assert index_counts(database) == [1, 1, 1]
+
+    weatherapp.update_search(search_id, 'Apia, Samoa', '2025-01-01', '2025-01-02')
+    assert weatherapp.find_searches('suva') == []
+    assert ids(weatherapp.find_searches('apia')) == [search_id]
+
+    # Moving the point across the antimeridian moves its R*Tree box too
+    database.execute('UPDATE searches SET lat=?, lon=? WHERE id=?', (-13.8, -171.8, search_id))
+    assert weatherapp.find_searches(lat=-17.7, lon=179.95, radius_km=50) == []
+    assert ids(weatherapp.find_searches(lat=-13.8, lon=-171.8, radius_km=10)) == [search_id]
+
+    weatherapp.delete_search(search_id)
+    assert index_counts(database) == [0, 0, 0]
+    assert weatherapp.find_searches('apia') == []
+    assert weatherapp.find_searches(lat=-13.8, lon=-171.8, radius_km=10) == []
@@ -0,0 +1,54 @@
+import sqlite3
+import threading
+
+import pytest
+
+import weatherapp
+
+
+def save(location, flush):
+    args = (location, 40.0, -74.0, '2025-01-01', '2025-01-02', 10.0, 9.0, 50, 'clear sky', 3.0)
+    if flush:
+        return weatherapp.save_to_db(*args)
+    return weatherapp.save_to_db_async(*args)
+
+
+def test_ids_match_rows_across_threads(database):
+    results = []
+    lock = threading.Lock()
+
+    def submitter(thread):
+        saved = []
+        for i in range(50):
+            location = f'T{thread} R{i}'
+            # Every third save blocks on its id; the rest are batched
+            if i % 3 == 0:
+                saved.append((save(location, True), location))
+            else:
+                saved.append((save(location, False), location))
+        with lock:
+            results.extend(saved)
+
+    threads = [threading.Thread(target=submitter, args=(n,)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    weatherapp.search_writer.flush()
+
+    ids = [result if isinstance(result, int) else result.result() for result, _ in results]
+    assert len(set(ids)) == len(ids) == 300
+    for search_id, (_, location) in zip(ids, results):
+        assert weatherapp.get_search(search_id).location == location
+    assert database.query('SELECT COUNT(*) FROM searches')[0][0] == 300
+
+def test_failed_batch_fails_every_future(database):
+    writer = weatherapp.SearchWriter(database=database)
+    try:
+        futures = [writer.submit(('too', 'few', 'columns')) for _ in range(3)]
+        writer.flush()
+        for future in futures:
+            with pytest.raises(sqlite3.Error):
+                future.result(timeout=5)
+    finally:
+        writer.close()
@@ -6,24 +6,300 @@ Created on Tue Nov 11 19:57:16 2025
 @author: aravkekane
 """
 
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import requests
 import sqlite3
-from datetime import datetime, timedelta
-import json
-import csv
-from geopy.geocoders import Nominatim
+import sys
+from datetime import datetime, timedelta, timezone
+from array import array
+import os
+import re
+import math
+import atexit
+import functools
+import time
+import threading
+import heapq
+import itertools
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+
+# tkinter is only imported when a window is opened (see load_tkinter), so
+# headless tools like batch.py can use this module without a display
+tk = ttk = messagebox = filedialog = None
+
+# requests and geopy take most of the import time, so they are loaded on the
+# first network call (see load_network) rather than before the window opens.
+# json, csv and the XML helpers are imported where they are used for the
+# same reason.
+requests = HTTPAdapter = Retry = Nominatim = GeocoderRateLimited = None
 
 API_KEY = "YOUR_API_KEY"
+API_BASE = "https://api.openweathermap.org/data/2.5"
+HISTORY_API_BASE = "https://api.openweathermap.org/data/3.0/onecall"
+NOMINATIM_DOMAIN = "nominatim.openstreetmap.org"
+NOMINATIM_SCHEME = "https"
+
+HTTP_POOL_SIZE = 4
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+
+# Request budgets: Nominatim's usage policy allows 1 request per second, and
+# the OpenWeatherMap free plan allows 60 calls per minute.
+NOMINATIM_RATE = 1.0
+OWM_CALLS_PER_MINUTE = 60
+
+# Background refresh of the most searched locations is opt-in; it spends
+# OpenWeatherMap calls the user didn't ask for
+REFRESH_ENABLED = False
+REFRESH_BUDGET_PER_MINUTE = 6
 
 DB_name = "weather_data.db"
+GEOCODE_DB_name = os.path.join(os.path.dirname(DB_name), "geocode_cache.db")
+RESPONSE_DB_name = os.path.join(os.path.dirname(DB_name), "response_cache.db")
+ARCHIVE_DIR = os.path.join(os.path.dirname(DB_name), "archive")
 
-def setup_database():
-    conn = sqlite3.connect(DB_name)
-    c = conn.cursor()
+# Retention: rows older than this many days, or beyond this many of the
+# newest rows, are moved to the archive. None turns a limit off.
+RETENTION_MAX_AGE_DAYS = None
+RETENTION_MAX_ROWS = None
+RETENTION_BATCH = 2000
+COMPACT_STEP_PAGES = 256
+
+# WEATHERAPP_TIMINGS=1 turns on span timings (any other value is a file the
+# report is written to on exit); WEATHERAPP_PROFILE=<file> also captures
+# cProfile stats for every timed call and writes them there on exit.
+TIMINGS_ENV = "WEATHERAPP_TIMINGS"
+PROFILE_ENV = "WEATHERAPP_PROFILE"
+
+class Timings:
+    # Span timings for the hot paths, kept per operation so slow searches can
+    # be pinned on Nominatim, the API, SQLite or the table. When disabled a
+    # timed call costs one attribute check, so the decorators stay in place.
+    def __init__(self, enabled=False, profile=False, samples=1000):
+        self.enabled = enabled or profile
+        self.profile = profile
+        self.samples = samples
+        self._spans = {}
+        self._profile_stats = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+    
+    def record(self, name, seconds, error=False):
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                span = self._spans[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'errors': 0,
+                                            'samples': deque(maxlen=self.samples)}
+            span['count'] += 1
+            span['total'] += seconds
+            span['max'] = max(span['max'], seconds)
+            span['samples'].append(seconds)
+            span['errors'] += error
+    
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+        
+        # Only the outermost span on a thread is profiled; cProfile can't nest
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        profiler = None
+        if self.profile and depth == 0:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        
+        local.depth = depth + 1
+        error = True
+        start = time.perf_counter()
+        try:
+            yield
+            error = False
+        finally:
+            elapsed = time.perf_counter() - start
+            local.depth = depth
+            if profiler is not None:
+                profiler.disable()
+                self._add_profile(profiler)
+            self.record(name, elapsed, error)
+    
+    def timed(self, name):
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+    
+    def _add_profile(self, profiler):
+        import pstats
+        with self._lock:
+            if self._profile_stats is None:
+                self._profile_stats = pstats.Stats(profiler)
+            else:
+                self._profile_stats.add(profiler)
+    
+    def stats(self):
+        report = {}
+        with self._lock:
+            for name, span in self._spans.items():
+                samples = sorted(span['samples'])
+                report[name] = {
+                    'count': span['count'],
+                    'errors': span['errors'],
+                    'total': span['total'],
+                    'mean': span['total'] / span['count'] if span['count'] else 0.0,
+                    'p50': samples[len(samples) // 2] if samples else 0.0,
+                    'p95': samples[int(len(samples) * 0.95)] if samples else 0.0,
+                    'p99': samples[int(len(samples) * 0.99)] if samples else 0.0,
+                    'max': span['max']
+                }
+        return report
+    
+    def report(self):
+        stats = self.stats()
+        if not stats:
+            return "No timings recorded." if self.enabled else "Timings are disabled."
+        
+        lines = [f"{'operation':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, span in sorted(stats.items(), key=lambda item: -item[1]['total']):
+            lines.append(f"{name:<16}{span['count']:>7}{span['p50'] * 1000:>10.1f}"
+                         f"{span['p95'] * 1000:>10.1f}{span['p99'] * 1000:>10.1f}{span['max'] * 1000:>10.1f}")
+        return '\n'.join(lines)
+    
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._profile_stats = None
+    
+    def dump(self, filename):
+        # .json gets the raw numbers, anything else the text table
+        if filename.endswith('.json'):
+            import json
+            with open(filename, 'w') as f:
+                json.dump(self.stats(), f, indent=2)
+        else:
+            with open(filename, 'w') as f:
+                f.write(self.report() + '\n')
+    
+    def dump_profile(self, filename):
+        with self._lock:
+            if self._profile_stats is None:
+                return False
+            self._profile_stats.dump_stats(filename)
+        return True
+
+timings = Timings(enabled=os.environ.get(TIMINGS_ENV, '') not in ('', '0'),
+                  profile=bool(os.environ.get(PROFILE_ENV)))
+if os.environ.get(TIMINGS_ENV, '') not in ('', '0', '1'):
+    atexit.register(timings.dump, os.environ[TIMINGS_ENV])
+if os.environ.get(PROFILE_ENV):
+    atexit.register(timings.dump_profile, os.environ[PROFILE_ENV])
+
+class Database:
+    # One long-lived connection shared by the GUI and the background workers.
+    # sqlite3 keeps compiled statements per connection, so reusing it also
+    # reuses the prepared INSERT/SELECT statements below.
+    def __init__(self, path=DB_name):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+    
+    def connect(self):
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+                # Only takes effect on a new file (before WAL or any table is
+                # set up); older ones need enable_incremental_vacuum()
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                conn.create_function('distance_km', 4, distance_km, deterministic=True)
+                self._conn = conn
+            return self._conn
+    
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            conn = self.connect()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def execute(self, sql, params=()):
+        with self.transaction() as conn:
+            return conn.execute(sql, params)
     
-    c.execute('''Create Table If NOT EXISTS searches
+    def query(self, sql, params=(), factory=None):
+        with self._lock:
+            cursor = self.connect().cursor()
+            cursor.row_factory = factory
+            return cursor.execute(sql, params).fetchall()
+    
+    @contextmanager
+    def synchronous(self, mode):
+        # Commits made inside run with PRAGMA synchronous=mode; everything
+        # else on the shared connection keeps the NORMAL set in connect()
+        with self._lock:
+            conn = self.connect()
+            if mode == 'NORMAL':
+                yield conn
+                return
+            conn.execute(f'PRAGMA synchronous={mode}')
+            try:
+                yield conn
+            finally:
+                conn.execute('PRAGMA synchronous=NORMAL')
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+EARTH_RADIUS_KM = 6371.0
+
+def distance_km(lat1, lon1, lat2, lon2):
+    # Great-circle (haversine) distance; NULL coordinates never match
+    if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
+        return None
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+db = Database()
+
+def use_database(path, caches=False):
+    # caches=True also moves the geocode and response caches and the archive
+    # beside the database, so the GUI, batch runs, the API server and the
+    # maintenance commands working on one database share all of them
+    global db, geocode_cache, response_cache, ARCHIVE_DIR
+    search_writer.flush()
+    db.close()
+    db = Database(path)
+    
+    if caches:
+        directory = os.path.dirname(os.path.abspath(path))
+        ARCHIVE_DIR = os.path.join(directory, 'archive')
+        geocode_path = os.path.join(directory, 'geocode_cache.db')
+        if os.path.abspath(geocode_cache.path) != geocode_path:
+            geocode_cache = GeocodeCache(geocode_path)
+        response_path = os.path.join(directory, 'response_cache.db')
+        if os.path.abspath(response_cache.path) != response_path:
+            response_cache = ResponseCache(response_path)
+    return db
+
+def migrate_create_searches(conn):
+    conn.execute('''Create Table If NOT EXISTS searches
               (id Integer PRIMARY KEY AUTOINCREMENT,
                location TEXT,
                lat REAL,
@@ -36,69 +312,946 @@ def setup_database():
                weather_desc TEXT,
                wind_speed REAL, 
                timestamp TEXT)''')
-    conn.commit()
-    conn.close()
+
+def migrate_add_search_indexes(conn):
+    # timestamp is stored as 'YYYY-MM-DD HH:MM:SS', which sorts the same as
+    # the time itself, so this index serves ORDER BY timestamp directly
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_searches_timestamp ON searches (timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_searches_location ON searches (location)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_searches_lat_lon ON searches (lat, lon)')
+
+def migrate_add_forecast_history(conn):
+    # Locations are keyed on the same 0.01 degree grid as the response cache
+    conn.execute('''CREATE TABLE IF NOT EXISTS locations
+                    (id INTEGER PRIMARY KEY,
+                     name TEXT,
+                     lat REAL,
+                     lon REAL,
+                     UNIQUE (lat, lon))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS forecast_points
+                    (location_id INTEGER NOT NULL REFERENCES locations (id),
+                     valid_time INTEGER NOT NULL,
+                     temp REAL,
+                     humidity INTEGER,
+                     wind REAL,
+                     description TEXT,
+                     fetched INTEGER,
+                     PRIMARY KEY (location_id, valid_time)) WITHOUT ROWID''')
+
+def migrate_add_weather_history(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS weather_history
+                    (location_id INTEGER NOT NULL REFERENCES locations (id),
+                     date TEXT NOT NULL,
+                     temp_min REAL,
+                     temp_max REAL,
+                     temp_afternoon REAL,
+                     humidity REAL,
+                     precip REAL,
+                     wind_max REAL,
+                     fetched INTEGER,
+                     PRIMARY KEY (location_id, date)) WITHOUT ROWID''')
+
+def migrate_add_search_lookup_indexes(conn):
+    # Full-text index over the place name and description, and an R*Tree over
+    # the coordinates. Both are keyed on searches.id and kept in sync by the
+    # triggers below, so every write path (GUI, batch, write-behind queue)
+    # maintains them without knowing they exist.
+    conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS searches_fts
+                    USING fts5(location, weather_desc, content='searches', content_rowid='id',
+                               tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')''')
+    conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS searches_rtree
+                    USING rtree(search_id, min_lat, max_lat, min_lon, max_lon)''')
+    
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS searches_fts_insert AFTER INSERT ON searches BEGIN
+                        INSERT INTO searches_fts (rowid, location, weather_desc)
+                        VALUES (new.id, new.location, new.weather_desc);
+                    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS searches_fts_delete AFTER DELETE ON searches BEGIN
+                        INSERT INTO searches_fts (searches_fts, rowid, location, weather_desc)
+                        VALUES ('delete', old.id, old.location, old.weather_desc);
+                    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS searches_fts_update
+                    AFTER UPDATE OF location, weather_desc ON searches BEGIN
+                        INSERT INTO searches_fts (searches_fts, rowid, location, weather_desc)
+                        VALUES ('delete', old.id, old.location, old.weather_desc);
+                        INSERT INTO searches_fts (rowid, location, weather_desc)
+                        VALUES (new.id, new.location, new.weather_desc);
+                    END''')
+    
+    # R*Tree boxes are stored as 32-bit floats rounded outwards, so the box is
+    # only a prefilter and distance_km() makes the exact check
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS searches_rtree_insert AFTER INSERT ON searches
+                    WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN
+                        INSERT INTO searches_rtree VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+                    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS searches_rtree_delete AFTER DELETE ON searches BEGIN
+                        DELETE FROM searches_rtree WHERE search_id = old.id;
+                    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS searches_rtree_update AFTER UPDATE OF lat, lon ON searches BEGIN
+                        DELETE FROM searches_rtree WHERE search_id = old.id;
+                        INSERT INTO searches_rtree SELECT new.id, new.lat, new.lat, new.lon, new.lon
+                        WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+                    END''')
+    
+    # Index the rows that are already there
+    conn.execute("INSERT INTO searches_fts (searches_fts) VALUES ('rebuild')")
+    conn.execute('''INSERT OR REPLACE INTO searches_rtree
+                    SELECT id, lat, lat, lon, lon FROM searches
+                    WHERE lat IS NOT NULL AND lon IS NOT NULL''')
+
+# Measures kept by every rollup: a row count plus sum/count pairs for the
+# averages (temp and humidity may be NULL, so they are counted separately)
+ROLLUP_MEASURES = 'searches, temp_sum, temp_count, humidity_sum, humidity_count'
+
+def rollup_keys(row):
+    location = f"coalesce({row}.location, '')"
+    day = f"coalesce(substr({row}.timestamp, 1, 10), '')"
+    bucket = f"CAST({row}.humidity / 10 AS INTEGER) * 10"
+    return location, day, bucket
+
+def rollup_add(row):
+    # Trigger statements counting one searches row (`new` or `old`) into
+    # every rollup table
+    location, day, bucket = rollup_keys(row)
+    values = (f"1, coalesce({row}.temp, 0), {row}.temp IS NOT NULL, "
+              f"coalesce({row}.humidity, 0), {row}.humidity IS NOT NULL")
+    merge = '''searches = searches + excluded.searches, temp_sum = temp_sum + excluded.temp_sum,
+               temp_count = temp_count + excluded.temp_count,
+               humidity_sum = humidity_sum + excluded.humidity_sum,
+               humidity_count = humidity_count + excluded.humidity_count'''
+    return f'''
+        INSERT INTO daily_rollups (location, day, {ROLLUP_MEASURES}) VALUES ({location}, {day}, {values})
+        ON CONFLICT (location, day) DO UPDATE SET {merge};
+        INSERT INTO location_rollups (location, {ROLLUP_MEASURES}) VALUES ({location}, {values})
+        ON CONFLICT (location) DO UPDATE SET {merge};
+        INSERT INTO humidity_rollups (location, bucket, searches)
+        SELECT {location}, {bucket}, 1 WHERE {row}.humidity IS NOT NULL
+        ON CONFLICT (location, bucket) DO UPDATE SET searches = searches + 1;'''
+
+def rollup_remove(row):
+    location, day, bucket = rollup_keys(row)
+    measures = f'''searches = searches - 1, temp_sum = temp_sum - coalesce({row}.temp, 0),
+                  temp_count = temp_count - ({row}.temp IS NOT NULL),
+                  humidity_sum = humidity_sum - coalesce({row}.humidity, 0),
+                  humidity_count = humidity_count - ({row}.humidity IS NOT NULL)'''
+    return f'''
+        UPDATE daily_rollups SET {measures} WHERE location = {location} AND day = {day};
+        DELETE FROM daily_rollups WHERE location = {location} AND day = {day} AND searches <= 0;
+        UPDATE location_rollups SET {measures} WHERE location = {location};
+        DELETE FROM location_rollups WHERE location = {location} AND searches <= 0;
+        UPDATE humidity_rollups SET searches = searches - 1
+        WHERE location = {location} AND bucket = {bucket};
+        DELETE FROM humidity_rollups WHERE location = {location} AND bucket = {bucket} AND searches <= 0;'''
+
+def migrate_add_rollups(conn):
+    # Aggregates over searches, kept current by triggers so reports read a
+    # handful of rollup rows instead of the whole history
+    measures = '''searches INTEGER NOT NULL,
+                  temp_sum REAL NOT NULL,
+                  temp_count INTEGER NOT NULL,
+                  humidity_sum REAL NOT NULL,
+                  humidity_count INTEGER NOT NULL'''
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS daily_rollups
+                     (location TEXT NOT NULL,
+                      day TEXT NOT NULL,
+                      {measures},
+                      PRIMARY KEY (location, day)) WITHOUT ROWID''')
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS location_rollups
+                     (location TEXT PRIMARY KEY,
+                      {measures}) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_location_rollups_searches ON location_rollups (searches)')
+    conn.execute('''CREATE TABLE IF NOT EXISTS humidity_rollups
+                    (location TEXT NOT NULL,
+                     bucket INTEGER NOT NULL,
+                     searches INTEGER NOT NULL,
+                     PRIMARY KEY (location, bucket)) WITHOUT ROWID''')
+    
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS rollups_insert AFTER INSERT ON searches BEGIN
+                     {rollup_add('new')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS rollups_delete AFTER DELETE ON searches BEGIN
+                     {rollup_remove('old')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS rollups_update
+                     AFTER UPDATE OF location, temp, humidity, timestamp ON searches BEGIN
+                     {rollup_remove('old')}
+                     {rollup_add('new')}
+                     END''')
+    
+    rebuild_rollups(conn)
+
+def rebuild_rollups(conn=None, archive_dir=None):
+    # Recomputes every rollup from searches plus the archived rows (read
+    # back from archive_dir, by default ARCHIVE_DIR), since archiving keeps
+    # rows counted. The migrations run it; it is safe to rerun, e.g. after
+    # editing searches with the triggers off.
+    if conn is None:
+        with db.transaction() as conn:
+            return rebuild_rollups(conn, archive_dir)
+    
+    conn.execute('''CREATE TEMP TABLE IF NOT EXISTS rollup_source
+                    (id INTEGER PRIMARY KEY, location TEXT, temp REAL, humidity INTEGER, timestamp TEXT)''')
+    conn.execute('DELETE FROM temp.rollup_source')
+    conn.execute('''INSERT INTO temp.rollup_source
+                    SELECT id, location, temp, humidity, timestamp FROM searches''')
+    # An id already in the table is a row archived by a run that died
+    # before deleting it; it counts once
+    conn.executemany('INSERT OR IGNORE INTO temp.rollup_source VALUES (?, ?, ?, ?, ?)',
+                     ((row.id, row.location, row.temp, row.humidity, row.timestamp)
+                      for row in iter_archived(archive_dir=archive_dir)))
     
+    conn.execute('DELETE FROM daily_rollups')
+    conn.execute('DELETE FROM location_rollups')
+    conn.execute('DELETE FROM humidity_rollups')
+    conn.execute(f'''INSERT INTO daily_rollups (location, day, {ROLLUP_MEASURES})
+                     SELECT coalesce(location, ''), coalesce(substr(timestamp, 1, 10), ''),
+                            count(*), coalesce(sum(temp), 0), count(temp),
+                            coalesce(sum(humidity), 0), count(humidity)
+                     FROM temp.rollup_source GROUP BY 1, 2''')
+    conn.execute(f'''INSERT INTO location_rollups (location, {ROLLUP_MEASURES})
+                     SELECT location, sum(searches), sum(temp_sum), sum(temp_count),
+                            sum(humidity_sum), sum(humidity_count)
+                     FROM daily_rollups GROUP BY location''')
+    conn.execute('''INSERT INTO humidity_rollups (location, bucket, searches)
+                    SELECT coalesce(location, ''), CAST(humidity / 10 AS INTEGER) * 10, count(*)
+                    FROM temp.rollup_source WHERE humidity IS NOT NULL GROUP BY 1, 2''')
+    rows = conn.execute('SELECT count(*) FROM temp.rollup_source').fetchone()[0]
+    conn.execute('DROP TABLE temp.rollup_source')
+    return rows
+
+def migrate_keep_archived_in_rollups(conn):
+    # Archiving moves rows out of searches but they still happened, so
+    # top_locations() and the other reports keep counting them. A row in
+    # archiving, written and removed inside apply_retention's delete
+    # transaction, makes rollups_delete skip those deletes.
+    conn.execute('CREATE TABLE IF NOT EXISTS archiving (flag INTEGER NOT NULL)')
+    conn.execute('DROP TRIGGER IF EXISTS rollups_delete')
+    conn.execute(f'''CREATE TRIGGER rollups_delete AFTER DELETE ON searches
+                     WHEN NOT EXISTS (SELECT 1 FROM archiving) BEGIN
+                     {rollup_remove('old')}
+                     END''')
+    
+    # Put back whatever earlier retention runs took out
+    rebuild_rollups(conn)
+
+# Applied in order; PRAGMA user_version records how many have run, so an
+# existing weather_data.db is upgraded in place on the next start.
+MIGRATIONS = [
+    migrate_create_searches,
+    migrate_add_search_indexes,
+    migrate_add_forecast_history,
+    migrate_add_weather_history,
+    migrate_add_search_lookup_indexes,
+    migrate_add_rollups,
+    migrate_keep_archived_in_rollups,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version():
+    return db.query('PRAGMA user_version')[0][0]
+
+def setup_database():
+    with db.transaction() as conn:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        
+        for number in range(version, len(MIGRATIONS)):
+            conn.execute('BEGIN')
+            try:
+                MIGRATIONS[number](conn)
+                conn.execute(f'PRAGMA user_version = {number + 1}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+def explain_query_plan(sql, params=()):
+    return [row[3] for row in db.query('EXPLAIN QUERY PLAN ' + sql, params)]
+    
+class SearchRecord:
+    # One row of the searches table. Built straight from the cursor by
+    # search_record_factory, so no intermediate tuple or dict is kept.
+    __slots__ = ('id', 'location', 'lat', 'lon', 'start_date', 'end_date', 'temp',
+                 'feels_like', 'humidity', 'weather_desc', 'wind_speed', 'timestamp')
+    
+    def __init__(self, id, location, lat, lon, start_date, end_date, temp,
+                 feels_like, humidity, weather_desc, wind_speed, timestamp):
+        self.id = id
+        self.location = location
+        self.lat = lat
+        self.lon = lon
+        self.start_date = start_date
+        self.end_date = end_date
+        self.temp = temp
+        self.feels_like = feels_like
+        self.humidity = humidity
+        self.weather_desc = weather_desc
+        self.wind_speed = wind_speed
+        self.timestamp = timestamp
+    
+    def __iter__(self):
+        return iter((self.id, self.location, self.lat, self.lon, self.start_date, self.end_date,
+                     self.temp, self.feels_like, self.humidity, self.weather_desc,
+                     self.wind_speed, self.timestamp))
+    
+    def __eq__(self, other):
+        return isinstance(other, SearchRecord) and tuple(self) == tuple(other)
+    
+    def __repr__(self):
+        return f"SearchRecord(id={self.id!r}, location={self.location!r}, timestamp={self.timestamp!r})"
+
+def search_record_factory(cursor, row):
+    return SearchRecord(*row)
+
+SEARCH_COLUMNS = '''id, location, lat, lon, start_date, end_date, temp,
+                    feels_like, humidity, weather_desc, wind_speed, timestamp'''
+
+INSERT_SEARCH = '''INSERT INTO searches (location, lat, lon, start_date, end_date,
+                 temp, feels_like, humidity, weather_desc, wind_speed, timestamp)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+SYNCHRONOUS_MODES = {'off': 'OFF', 'normal': 'NORMAL', 'full': 'FULL'}
+
+class SearchWriter:
+    # Write-behind queue for new searches. Rows submitted from any thread are
+    # written by one background thread with executemany, one transaction per
+    # batch. A batch is flushed once it holds max_batch rows or its first row
+    # has waited max_delay seconds, or at once when a submitter is blocked
+    # on its row (flush=True). durability picks PRAGMA synchronous ('off',
+    # 'normal' or 'full') for the writer's own commits only.
+    def __init__(self, max_batch=200, max_delay=0.02, durability='normal', database=None):
+        if durability not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.durability = durability
+        self.database = database
+        self.batches = 0
+        self.rows = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._flush_now = False
+    
+    def submit(self, row, flush=False):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Search writer is closed")
+            
+            self._pending.append((time.monotonic(), row, future))
+            if flush:
+                self._flush_now = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='search-writer', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return future
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                
+                deadline = self._pending[0][0] + self.max_delay
+                while (len(self._pending) < self.max_batch and not self._closed
+                       and not self._flush_now):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                if not self._pending:
+                    self._flush_now = False
+            
+            self._write(batch)
+    
+    @timings.timed('db_write')
+    def _write(self, batch):
+        database = self.database or db
+        try:
+            with database.synchronous(SYNCHRONOUS_MODES[self.durability]), \
+                    database.transaction() as conn:
+                conn.executemany(INSERT_SEARCH, [row for _, row, _ in batch])
+                # AUTOINCREMENT ids inside one transaction are consecutive
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        
+        self.batches += 1
+        self.rows += len(batch)
+        first_id = last_id - len(batch) + 1
+        for offset, (_, _, future) in enumerate(batch):
+            future.set_result(first_id + offset)
+    
+    def flush(self):
+        with self._cond:
+            futures = [future for _, _, future in self._pending]
+            if not futures:
+                return
+            self._flush_now = True
+            self._cond.notify_all()
+        wait(futures)
+    
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+search_writer = SearchWriter()
+atexit.register(search_writer.close)
+
+def save_to_db_async(location, lat, lon, start, end, temp, feels, humidity, desc, wind, flush=False):
+    # Batched with whatever else arrives within the writer's max_delay,
+    # unless flush asks for the pending rows to go out now
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return search_writer.submit((location, lat, lon, start, end, temp, feels, humidity,
+                                 desc, wind, now), flush)
+
+@timings.timed('save_to_db')
 def save_to_db(location, lat, lon, start, end, temp, feels, humidity, desc, wind):
-    conn = sqlite3.connect(DB_name)
-    c = conn.cursor()
+    # The caller waits for the id, so don't make it sit out max_delay
+    return save_to_db_async(location, lat, lon, start, end, temp, feels, humidity,
+                            desc, wind, flush=True).result()
+
+def save_many(records):
+    # records are save_to_db argument tuples; all of them go in one transaction
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    c.execute('''INSERT INTO searches (location, lat, lon, start_date, end_date,
-                 temp, feels_like, humidity, weather_desc, wind_speed, timestamp)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-              (location, lat, lon, start, end, temp, feels, humidity, desc, wind, now))
-    conn.commit()
-    conn.close()
-    return c.lastrowid
+    with db.transaction() as conn:
+        conn.executemany(INSERT_SEARCH, [tuple(record) + (now,) for record in records])
 
 def get_all_searches():
-    conn = sqlite3.connect(DB_name)
-    c = conn.cursor()
-    
-    c.execute('SELECT * FROM searches ORDER BY timestamp DESC')
-    rows = c.fetchall()
+    return db.query(f'SELECT {SEARCH_COLUMNS} FROM searches ORDER BY timestamp DESC',
+                    factory=search_record_factory)
+
+PAGE_SIZE = 200
+
+def get_searches_page(after=None, limit=PAGE_SIZE):
+    # Keyset pagination, newest first. `after` is the (timestamp, id) of the
+    # last row already shown; the index on timestamp (plus the rowid) makes
+    # every page an index range scan no matter how deep it is.
+    if after is None:
+        return db.query(f'''SELECT {SEARCH_COLUMNS} FROM searches
+                            ORDER BY timestamp DESC, id DESC LIMIT ?''',
+                        (limit,), search_record_factory)
     
-    conn.close()
-    return rows
+    return db.query(f'''SELECT {SEARCH_COLUMNS} FROM searches WHERE (timestamp, id) < (?, ?)
+                        ORDER BY timestamp DESC, id DESC LIMIT ?''',
+                    (after[0], after[1], limit), search_record_factory)
+
+def get_search(search_id):
+    rows = db.query(f'SELECT {SEARCH_COLUMNS} FROM searches WHERE id=?', (search_id,),
+                    search_record_factory)
+    return rows[0] if rows else None
 
 def update_search(search_id, location, start, end):
-    conn = sqlite3.connect(DB_name)
-    c = conn.cursor()
-    
-    c.execute('''UPDATE searches SET location=?, start_date=?, end_date=?
+    db.execute('''UPDATE searches SET location=?, start_date=?, end_date=?
                  WHERE id=?''', (location, start, end, search_id))
-    
-    conn.commit()
-    conn.close()
 
 def delete_search(search_id):
-    conn = sqlite3.connect(DB_name)
-    c = conn.cursor()
+    db.execute('DELETE FROM searches WHERE id=?', (search_id,))
+
+def fts_query(text):
+    # User text -> FTS5 query: every word must match, as a prefix, so
+    # "new yo" finds "New York". Quoting keeps FTS5 syntax characters inert.
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join('"' + word + '"*' for word in words)
+
+def bounding_box(lat, lon, radius_km):
+    # Latitude/longitude ranges covering radius_km around a point. Boxes that
+    # cross the antimeridian are split in two; near the poles every
+    # longitude is included.
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return min_lat, max_lat, [(-180.0, 180.0)]
     
-    c.execute('DELETE FROM searches WHERE id=?', (search_id,))
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(lat))))
+    if dlon >= 180.0:
+        return min_lat, max_lat, [(-180.0, 180.0)]
+    
+    west, east = lon - dlon, lon + dlon
+    if west < -180.0:
+        return min_lat, max_lat, [(west + 360.0, 180.0), (-180.0, east)]
+    if east > 180.0:
+        return min_lat, max_lat, [(west, 180.0), (-180.0, east - 360.0)]
+    return min_lat, max_lat, [(west, east)]
+
+# Above this many R*Tree candidates, a text + distance query collects the
+# text matches in one pass instead of probing the full-text index per row
+FTS_PROBE_LIMIT = 2000
+
+def find_searches(text=None, lat=None, lon=None, radius_km=None, before=None, limit=PAGE_SIZE):
+    # Saved searches matching a text query and/or lying within radius_km of
+    # (lat, lon), newest first. `before` is the id of the last row already
+    # shown, for paging. Returns None if there is nothing to filter on.
+    spatial = radius_km is not None and lat is not None and lon is not None
+    if not text and not spatial:
+        return None
     
-    conn.commit()
-    conn.close()
+    match = None
+    if text:
+        match = fts_query(text)
+        if match is None:
+            return []
+    
+    conditions = []
+    params = []
+    
+    if spatial:
+        # Drive from the R*Tree: its box is the smaller candidate set
+        min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+        box = ('r.max_lat >= ? AND r.min_lat <= ? AND ('
+               + ' OR '.join(['(r.max_lon >= ? AND r.min_lon <= ?)'] * len(lon_ranges)) + ')')
+        box_params = [min_lat, max_lat] + [bound for lon_range in lon_ranges for bound in lon_range]
+        
+        tables = 'searches_rtree r CROSS JOIN searches s ON s.id = r.search_id'
+        conditions += [box, 'distance_km(s.lat, s.lon, ?, ?) <= ?']
+        params += box_params + [lat, lon, radius_km]
+        order = 's.id'
+        
+        if match is not None:
+            candidates = db.query(f'SELECT count(*) FROM searches_rtree r WHERE {box}', box_params)[0][0]
+            if candidates <= FTS_PROBE_LIMIT:
+                tables += ' CROSS JOIN searches_fts ON searches_fts.rowid = s.id'
+                conditions.append('searches_fts MATCH ?')
+            else:
+                conditions.append('s.id IN (SELECT rowid FROM searches_fts WHERE searches_fts MATCH ?)')
+            params.append(match)
+    else:
+        # Walk the full-text index newest first so LIMIT can stop early
+        tables = 'searches_fts CROSS JOIN searches s ON s.id = searches_fts.rowid'
+        conditions.append('searches_fts MATCH ?')
+        params.append(match)
+        order = 'searches_fts.rowid'
+    
+    if before is not None:
+        conditions.append(f'{order} < ?')
+        params.append(before)
+    
+    columns = ', '.join('s.' + name for name in SearchRecord.__slots__)
+    return db.query(f'''SELECT {columns} FROM {tables} WHERE {' AND '.join(conditions)}
+                        ORDER BY {order} DESC LIMIT ?''', params + [limit], search_record_factory)
+
+DailyRollup = namedtuple('DailyRollup', ['location', 'day', 'searches', 'avg_temp', 'avg_humidity'])
+
+LocationRollup = namedtuple('LocationRollup', ['location', 'searches', 'avg_temp', 'avg_humidity'])
+
+ROLLUP_AVERAGES = '''searches, CASE WHEN temp_count THEN temp_sum / temp_count END,
+                     CASE WHEN humidity_count THEN humidity_sum / humidity_count END'''
+
+def daily_averages(location, start=None, end=None):
+    # Per-day search count and average temp/humidity for one location,
+    # between two 'YYYY-MM-DD' days inclusive
+    rows = db.query(f'''SELECT location, day, {ROLLUP_AVERAGES} FROM daily_rollups
+                        WHERE location = ? AND day >= ? AND day <= ? ORDER BY day''',
+                    (location, start or '', end or '9999-12-31'))
+    return [DailyRollup(*row) for row in rows]
+
+def location_summary(location):
+    rows = db.query(f'SELECT location, {ROLLUP_AVERAGES} FROM location_rollups WHERE location = ?',
+                    (location,))
+    return LocationRollup(*rows[0]) if rows else None
+
+def top_locations(limit=10):
+    # Most searched locations first
+    rows = db.query(f'''SELECT location, {ROLLUP_AVERAGES} FROM location_rollups
+                        ORDER BY searches DESC LIMIT ?''', (limit,))
+    return [LocationRollup(*row) for row in rows]
+
+def humidity_distribution(location=None):
+    # {bucket: searches} in 10% buckets (50 means 50-59%), for one location
+    # or across all of them
+    if location is None:
+        rows = db.query('SELECT bucket, sum(searches) FROM humidity_rollups GROUP BY bucket ORDER BY bucket')
+    else:
+        rows = db.query('SELECT bucket, searches FROM humidity_rollups WHERE location = ? ORDER BY bucket',
+                        (location,))
+    return dict(rows)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_BACKGROUND = 2
+
+class RateLimitError(Exception):
+    def __init__(self, provider, retry_after=None):
+        self.provider = provider
+        self.retry_after = retry_after
+        wait = f", retry in {retry_after:.0f} s" if retry_after else ""
+        super().__init__(f"{provider} rate limit reached{wait}")
+
+class ServerError(Exception):
+    # A 5xx from a provider. The scheduler retries these itself, so each
+    # attempt waits for and spends a token like any other request.
+    def __init__(self, provider, status):
+        self.provider = provider
+        self.status = status
+        super().__init__(f"{provider} returned HTTP {status}")
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+    
+    def wait_time(self):
+        # Seconds until a token is available; 0 means take() will succeed
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    def take(self):
+        self.tokens -= 1
+    
+    def try_take(self):
+        # wait_time() and take() in one step: takes a token if one is
+        # available, else returns how long until there is one
+        wait = self.wait_time()
+        if wait == 0:
+            self.take()
+        return wait
+    
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+class _ScheduledCall:
+    # seq is the sequence number of the call's live heap entry, or None
+    # while it isn't queued (running, or waiting out a retry backoff)
+    __slots__ = ('key', 'fn', 'priority', 'future', 'enqueued', 'attempts', 'seq')
+    
+    def __init__(self, key, fn, priority):
+        self.key = key
+        self.fn = fn
+        self.priority = priority
+        self.future = Future()
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+        self.seq = None
+
+class RequestScheduler:
+    # Every outbound call goes through here. Each provider has a token bucket
+    # and a priority queue (interactive searches before bulk and background
+    # work), and identical requests already queued or running share a future.
+    def __init__(self, limits=None, workers=8, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+        limits = limits or {
+            'nominatim': (NOMINATIM_RATE, 1),
+            'openweathermap': (OWM_CALLS_PER_MINUTE / 60.0, 10)
+        }
+        self.retries = retries
+        self.backoff = backoff
+        self._buckets = {name: TokenBucket(rate, capacity) for name, (rate, capacity) in limits.items()}
+        self._queues = {name: [] for name in limits}
+        self._in_flight = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scheduler')
+        self._dispatchers = {}
+        self._stats = {name: {'submitted': 0, 'deduplicated': 0, 'completed': 0, 'failed': 0,
+                              'throttled': 0, 'retried': 0, 'waits': deque(maxlen=1000)}
+                       for name in limits}
+    
+    def set_limit(self, provider, rate, capacity):
+        self.set_bucket(provider, TokenBucket(rate, capacity))
+    
+    def set_bucket(self, provider, bucket):
+        # Anything with TokenBucket's interface, e.g. one shared between processes
+        with self._cond:
+            self._buckets[provider] = bucket
+            self._cond.notify_all()
+    
+    def limits(self):
+        with self._cond:
+            return {name: (bucket.rate, bucket.capacity) for name, bucket in self._buckets.items()}
+    
+    def submit(self, provider, key, fn, priority=PRIORITY_INTERACTIVE):
+        with self._cond:
+            stats = self._stats[provider]
+            stats['submitted'] += 1
+            
+            call = self._in_flight.get((provider, key))
+            if call is not None:
+                stats['deduplicated'] += 1
+                if priority < call.priority and call.seq is not None:
+                    # A more urgent duplicate of a queued call moves it up;
+                    # _dispatch drops the old heap entry when it surfaces
+                    call.priority = priority
+                    self._push(provider, call)
+                    self._cond.notify_all()
+                return call.future
+            
+            call = _ScheduledCall(key, fn, priority)
+            self._in_flight[(provider, key)] = call
+            self._push(provider, call)
+            
+            if provider not in self._dispatchers:
+                thread = threading.Thread(target=self._dispatch, args=(provider,),
+                                          name=f'scheduler-{provider}', daemon=True)
+                self._dispatchers[provider] = thread
+                thread.start()
+            self._cond.notify_all()
+            return call.future
+    
+    def call(self, provider, key, fn, priority=PRIORITY_INTERACTIVE):
+        return self.submit(provider, key, fn, priority).result()
+    
+    def _push(self, provider, call):
+        call.seq = next(self._seq)
+        heapq.heappush(self._queues[provider], (call.priority, call.seq, call))
+    
+    def _dispatch(self, provider):
+        queue = self._queues[provider]
+        while True:
+            with self._cond:
+                while True:
+                    # Skip entries superseded by a priority bump
+                    while queue and queue[0][1] != queue[0][2].seq:
+                        heapq.heappop(queue)
+                    if queue:
+                        break
+                    self._cond.wait()
+                
+                wait = self._buckets[provider].try_take()
+                if wait > 0:
+                    # Woken early if a new (maybe more urgent) call arrives
+                    self._cond.wait(wait)
+                    continue
+                
+                _, _, call = heapq.heappop(queue)
+                call.seq = None
+                self._stats[provider]['waits'].append(time.monotonic() - call.enqueued)
+            
+            self._pool.submit(self._run, provider, call)
+    
+    def _requeue(self, provider, call):
+        with self._cond:
+            call.enqueued = time.monotonic()
+            self._push(provider, call)
+            self._cond.notify_all()
+    
+    def _run(self, provider, call):
+        try:
+            result = call.fn()
+        except ServerError as e:
+            if call.attempts >= self.retries:
+                self._fail(provider, call, e)
+                return
+            # Back into the queue after a backoff; stays in _in_flight so
+            # identical requests keep sharing it meanwhile
+            with self._cond:
+                self._stats[provider]['retried'] += 1
+            delay = self.backoff * 2 ** call.attempts
+            call.attempts += 1
+            timer = threading.Timer(delay, self._requeue, (provider, call))
+            timer.daemon = True
+            timer.start()
+        except Exception as e:
+            self._fail(provider, call, e)
+        else:
+            with self._cond:
+                self._stats[provider]['completed'] += 1
+                self._in_flight.pop((provider, call.key), None)
+            call.future.set_result(result)
+    
+    def _fail(self, provider, call, e):
+        throttled = isinstance(e, RateLimitError) or (
+            GeocoderRateLimited is not None and isinstance(e, GeocoderRateLimited))
+        with self._cond:
+            stats = self._stats[provider]
+            stats['failed'] += 1
+            if throttled:
+                stats['throttled'] += 1
+                self._buckets[provider].pause(e.retry_after or 60)
+            self._in_flight.pop((provider, call.key), None)
+        call.future.set_exception(e)
+    
+    def stats(self):
+        report = {}
+        with self._cond:
+            for provider, stats in self._stats.items():
+                waits = sorted(stats['waits'])
+                report[provider] = {
+                    'submitted': stats['submitted'],
+                    'deduplicated': stats['deduplicated'],
+                    'completed': stats['completed'],
+                    'failed': stats['failed'],
+                    'throttled': stats['throttled'],
+                    'retried': stats['retried'],
+                    'queued': sum(1 for _, seq, call in self._queues[provider] if seq == call.seq),
+                    'wait_p50': waits[len(waits) // 2] if waits else 0.0,
+                    'wait_p95': waits[int(len(waits) * 0.95)] if waits else 0.0,
+                    'wait_max': waits[-1] if waits else 0.0
+                }
+        return report
+
+scheduler = RequestScheduler()
+
+class GeocodeCache:
+    # Keeps geocode/reverse results in a small SQLite file so repeated
+    # lookups ("New York" etc.) never reach Nominatim.
+    def __init__(self, path=GEOCODE_DB_name, ttl=30 * 24 * 3600, max_entries=10000, grid=0.001):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.grid = grid
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            # WAL so bulk worker processes can share the file
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS geocode_cache
+                              (key TEXT PRIMARY KEY,
+                               lat REAL,
+                               lon REAL,
+                               address TEXT,
+                               created REAL,
+                               last_used REAL)''')
+            self._conn.execute('''CREATE INDEX IF NOT EXISTS idx_geocode_last_used
+                              ON geocode_cache (last_used)''')
+            self._conn.commit()
+        return self._conn
+    
+    def query_key(self, text):
+        text = re.sub(r'\s+', ' ', text.strip().lower())
+        return 'q:' + re.sub(r'\s*,\s*', ',', text)
+    
+    def reverse_key(self, lat, lon):
+        lat = round(lat / self.grid) * self.grid
+        lon = round(lon / self.grid) * self.grid
+        return f'r:{lat:.6f},{lon:.6f}'
+    
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT lat, lon, address, created FROM geocode_cache WHERE key=?',
+                               (key,)).fetchone()
+            
+            if row is None or now - row[3] > self.ttl:
+                if row is not None:
+                    conn.execute('DELETE FROM geocode_cache WHERE key=?', (key,))
+                    conn.commit()
+                self.misses += 1
+                return None
+            
+            conn.execute('UPDATE geocode_cache SET last_used=? WHERE key=?', (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0], row[1], row[2]
+    
+    def put(self, key, lat, lon, address):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute('''INSERT OR REPLACE INTO geocode_cache
+                            (key, lat, lon, address, created, last_used)
+                            VALUES (?, ?, ?, ?, ?, ?)''', (key, lat, lon, address, now, now))
+            
+            count = conn.execute('SELECT COUNT(*) FROM geocode_cache').fetchone()[0]
+            if count > self.max_entries:
+                conn.execute('''DELETE FROM geocode_cache WHERE key IN
+                                (SELECT key FROM geocode_cache ORDER BY last_used LIMIT ?)''',
+                             (count - self.max_entries,))
+            conn.commit()
+    
+    def clear(self):
+        with self._lock:
+            self._connect().execute('DELETE FROM geocode_cache')
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self):
+        with self._lock:
+            size = self._connect().execute('SELECT COUNT(*) FROM geocode_cache').fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'entries': size
+        }
+
+geocode_cache = GeocodeCache()
+
+_geolocator = None
+
+def get_geolocator():
+    global _geolocator
+    if _geolocator is None:
+        load_network()
+        _geolocator = Nominatim(user_agent="weatherapp", domain=NOMINATIM_DOMAIN,
+                                scheme=NOMINATIM_SCHEME)
+    return _geolocator
+
+def configure_geolocator(domain="nominatim.openstreetmap.org", scheme="https"):
+    global NOMINATIM_DOMAIN, NOMINATIM_SCHEME, _geolocator
+    NOMINATIM_DOMAIN = domain
+    NOMINATIM_SCHEME = scheme
+    _geolocator = None
+
+@timings.timed('check_location')
+def check_location(location_text, geolocator=None, cache=None, priority=PRIORITY_INTERACTIVE):
+    if cache is None:
+        cache = geocode_cache
     
-def check_location(location_text):
     try:
         if ',' in location_text:
             parts = location_text.split(',')
             lat = float(parts[0].strip())
             lon = float(parts[1].strip())
             
-            geolocator = Nominatim(user_agent = "weatherapp")
-            place = geolocator.reverse(f"{lat}, {lon}", timeout=10)
+            key = cache.reverse_key(lat, lon)
+            cached = cache.get(key)
+            if cached:
+                return True, lat, lon, cached[2]
+            
+            geolocator = geolocator or get_geolocator()
+            place = scheduler.call('nominatim', key,
+                                   lambda: geolocator.reverse(f"{lat}, {lon}", timeout=10), priority)
             
             if place:
+                cache.put(key, lat, lon, place.address)
                 return True, lat, lon, place.address
             else: 
                 return True, lat, lon, location_text
-            
-        geolocator = Nominatim(user_agent="weatherapp")
-        place = geolocator.geocode(location_text, timeout=10)
+        
+        key = cache.query_key(location_text)
+        cached = cache.get(key)
+        if cached:
+            return True, cached[0], cached[1], cached[2]
+        
+        geolocator = geolocator or get_geolocator()
+        place = scheduler.call('nominatim', key,
+                               lambda: geolocator.geocode(location_text, timeout=10), priority)
         
         if place:
+            cache.put(key, place.latitude, place.longitude, place.address)
             return True, place.latitude, place.longitude, place.address
         else: 
             return False, None, None, "Location Not Found"
@@ -129,125 +1282,1025 @@ def check_dates(start, end):
     except:
         return False, "Invalid date format"
     
-def get_weather(lat, lon):
-    if API_KEY == "YOUR_API_KEY_HERE" :
-        return None, "Please Add Your API KEY First!!"
+class PayloadError(ValueError):
+    def __init__(self, kind, problem):
+        self.kind = kind
+        super().__init__(f"Malformed {kind} response: {problem}")
+
+# orjson is used when installed; set_json_decoder() can plug in another
+# loads() that accepts bytes or str. Picked on the first decode.
+json_decoder = None
+
+def default_json_decoder():
+    try:
+        import orjson
+        return orjson.loads
+    except ImportError:
+        import json
+        return json.loads
+
+def set_json_decoder(decoder):
+    global json_decoder
+    json_decoder = decoder
+
+def decode_json(raw, kind='API'):
+    global json_decoder
+    if json_decoder is None:
+        json_decoder = default_json_decoder()
     
-    url = "https://api.openweathermap.org/data/2.5/weather"
+    try:
+        data = json_decoder(raw)
+    except ValueError as e:
+        raise PayloadError(kind, f"invalid JSON ({e})")
     
+    if not isinstance(data, dict):
+        raise PayloadError(kind, "expected a JSON object")
+    # OpenWeatherMap reports errors in the body as {"cod": ..., "message": ...}
+    if 'message' in data and str(data.get('cod', '200')) not in ('200', '0'):
+        raise PayloadError(kind, data['message'])
+    return data
+
+CurrentWeather = namedtuple('CurrentWeather',
+                            ['temp', 'feels_like', 'humidity', 'description', 'wind', 'pressure'])
+
+ForecastDay = namedtuple('ForecastDay', ['date', 'high', 'low', 'mean', 'precip', 'desc'])
+
+def parse_current(data):
     try:
-        response = requests.get(url, params={
-            'lat': lat,
-            'lon': lon,
-            'appid': API_KEY,
-            'units': 'metric'
-        }, timeout=10)
-        
-        data = response.json()
-        
-        weather = {
-            'temp': data['main']['temp'],
-            'feels_like': data['main']['feels_like'],
-            'humidity': data['main']['humidity'],
-            'description': data['weather'][0]['description'],
-            'wind': data['wind']['speed'],
-            'pressure': data['main']['pressure']
+        main = data['main']
+        return CurrentWeather(main['temp'], main['feels_like'], main['humidity'],
+                              data['weather'][0]['description'], data['wind']['speed'],
+                              main['pressure'])
+    except (KeyError, IndexError, TypeError) as e:
+        raise PayloadError('weather', f"missing field {e}")
+
+_session = None
+_session_lock = threading.Lock()
+
+def make_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+    load_network()
+    session = requests.Session()
+    # Only connection failures are retried here. 429s and 5xx responses go
+    # back to the scheduler (RateLimitError / ServerError), so every retry
+    # waits for a token and a 429 pauses the bucket straight away. urllib3
+    # would otherwise still retry any 429/503 that carries Retry-After.
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(),
+                  allowed_methods=('GET',), respect_retry_after_header=False,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+def configure_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = make_session(pool_size, retries, backoff)
+        return _session
+
+# ETag / Last-Modified validators from earlier responses, so a repeat request
+# can be answered with a 304 and the body we already have.
+_validators = OrderedDict()
+_validators_lock = threading.Lock()
+MAX_VALIDATORS = 256
+
+def fetch_api(endpoint, lat, lon, units='metric', base=None, params=None):
+    url = f"{base or API_BASE}/{endpoint}"
+    params = dict(params or {}, lat=lat, lon=lon, appid=API_KEY, units=units)
+    key = (url, tuple(sorted(params.items())))
+    
+    headers = {}
+    with _validators_lock:
+        cached = _validators.get(key)
+    if cached:
+        if cached[0]:
+            headers['If-None-Match'] = cached[0]
+        if cached[1]:
+            headers['If-Modified-Since'] = cached[1]
+    
+    response = get_session().get(url, params=params, headers=headers, timeout=10)
+    
+    if response.status_code == 304 and cached:
+        return cached[2]
+    
+    if response.status_code == 429:
+        retry_after = response.headers.get('Retry-After', '')
+        raise RateLimitError('OpenWeatherMap', float(retry_after) if retry_after.isdigit() else None)
+    if response.status_code >= 500:
+        raise ServerError('OpenWeatherMap', response.status_code)
+    
+    response.raise_for_status()
+    data = decode_json(response.content, endpoint)
+    
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if etag or last_modified:
+        with _validators_lock:
+            _validators[key] = (etag, last_modified, data)
+            _validators.move_to_end(key)
+            while len(_validators) > MAX_VALIDATORS:
+                _validators.popitem(last=False)
+    
+    return data
+
+def decoded_size(data):
+    # Approximate bytes held by a decoded JSON payload: every dict, list and
+    # scalar in it, with objects the decoder shares (repeated keys) counted once
+    seen = set()
+    total = 0
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return total
+
+class ResponseCache:
+    # Two-level (memory + SQLite) cache for API payloads keyed on a coordinate
+    # grid. Inside the fresh window an entry is served as is; inside the stale
+    # window it is served while a background refresh fetches a new copy.
+    # memory_budget is charged with the decoded size of the payloads held in
+    # memory, disk_budget with their serialized JSON.
+    def __init__(self, path=RESPONSE_DB_name, grid=0.01,
+                 fresh=None, stale=None,
+                 memory_budget=8 * 1024 * 1024, disk_budget=64 * 1024 * 1024):
+        self.path = path
+        self.grid = grid
+        self.fresh = fresh or {'weather': 600, 'forecast': 3 * 3600}
+        self.stale = stale or {'weather': 3600, 'forecast': 12 * 3600}
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.prefetch_hits = 0
+        self._prefetched = set()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._refreshing = set()
+        self._conn = None
+        self._lock = threading.RLock()
+    
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS response_cache
+                              (key TEXT PRIMARY KEY,
+                               endpoint TEXT,
+                               fetched REAL,
+                               last_used REAL,
+                               size INTEGER,
+                               body TEXT)''')
+            self._conn.execute('''CREATE INDEX IF NOT EXISTS idx_response_last_used
+                              ON response_cache (last_used)''')
+            self._conn.commit()
+        return self._conn
+    
+    def make_key(self, endpoint, lat, lon, units='metric'):
+        lat = round(lat / self.grid) * self.grid
+        lon = round(lon / self.grid) * self.grid
+        return f'{endpoint}:{units}:{lat:.4f},{lon:.4f}'
+    
+    def _remember(self, key, endpoint, fetched, data):
+        size = decoded_size(data)
+        old = self._memory.pop(key, None)
+        if old:
+            self._memory_bytes -= old[3]
+        self._memory[key] = (endpoint, fetched, data, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_budget and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted[3]
+    
+    def lookup(self, key, endpoint):
+        # Returns (data, state) where state is 'fresh', 'stale' or 'miss'
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                self._memory.move_to_end(key)
+                fetched, data = entry[1], entry[2]
+            else:
+                row = self._connect().execute(
+                    'SELECT fetched, body FROM response_cache WHERE key=?', (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None, 'miss'
+                fetched, data = row[0], decode_json(row[1], endpoint)
+                self._conn.execute('UPDATE response_cache SET last_used=? WHERE key=?', (now, key))
+                self._conn.commit()
+                self._remember(key, endpoint, fetched, data)
+            
+            age = now - fetched
+            if age <= self.fresh.get(endpoint, 0):
+                self.hits += 1
+                state = 'fresh'
+            elif age <= self.fresh.get(endpoint, 0) + self.stale.get(endpoint, 0):
+                self.stale_hits += 1
+                state = 'stale'
+            else:
+                self.misses += 1
+                return None, 'miss'
+            
+            if key in self._prefetched:
+                self._prefetched.discard(key)
+                self.prefetch_hits += 1
+            return data, state
+    
+    def fetched_at(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                return entry[1]
+            row = self._connect().execute('SELECT fetched FROM response_cache WHERE key=?',
+                                          (key,)).fetchone()
+            return row[0] if row else None
+    
+    def store(self, key, endpoint, data, prefetched=False):
+        import json
+        now = time.time()
+        body = json.dumps(data, separators=(',', ':'))
+        size = len(body)
+        with self._lock:
+            if prefetched:
+                self._prefetched.add(key)
+            self._remember(key, endpoint, now, data)
+            conn = self._connect()
+            conn.execute('''INSERT OR REPLACE INTO response_cache
+                            (key, endpoint, fetched, last_used, size, body)
+                            VALUES (?, ?, ?, ?, ?, ?)''', (key, endpoint, now, now, size, body))
+            
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM response_cache').fetchone()[0]
+            if total > self.disk_budget:
+                for old_key, old_size in conn.execute(
+                        'SELECT key, size FROM response_cache ORDER BY last_used').fetchall():
+                    if total <= self.disk_budget or old_key == key:
+                        break
+                    conn.execute('DELETE FROM response_cache WHERE key=?', (old_key,))
+                    total -= old_size
+            conn.commit()
+    
+    def revalidate(self, key, endpoint, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.revalidations += 1
+        
+        def refresh():
+            try:
+                self.store(key, endpoint, fetch())
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._connect().execute('DELETE FROM response_cache')
+            self._conn.commit()
+            self._prefetched.clear()
+            self.hits = self.stale_hits = self.misses = self.revalidations = self.prefetch_hits = 0
+    
+    def stats(self):
+        with self._lock:
+            disk_entries, disk_bytes = self._connect().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache').fetchone()
+            total = self.hits + self.stale_hits + self.misses
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'prefetch_hits': self.prefetch_hits,
+                'hit_ratio': (self.hits + self.stale_hits) / total if total else 0.0,
+                'prefetch_hit_ratio': self.prefetch_hits / total if total else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_entries': disk_entries,
+                'disk_bytes': disk_bytes
+            }
+    
+    def entries_by_age(self):
+        now = time.time()
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT key, endpoint, fetched, size FROM response_cache ORDER BY fetched DESC').fetchall()
+        return [{'key': key, 'endpoint': endpoint, 'age': now - fetched, 'size': size}
+                for key, endpoint, fetched, size in rows]
+
+response_cache = ResponseCache()
+
+def fetch_payload(endpoint, lat, lon, key, priority, units='metric', place_name=None):
+    # One upstream fetch through the scheduler. Forecasts are recorded here,
+    # where a new payload arrives, so cache hits never re-record one and the
+    # stored fetch time is when the data was actually fetched.
+    data = scheduler.call('openweathermap', key, lambda: fetch_api(endpoint, lat, lon, units), priority)
+    if endpoint == 'forecast' and units == 'metric':
+        fetched = int(time.time())
+        try:
+            forecast_recorder(lat, lon, parse_forecast(data), place_name, fetched)
+        except sqlite3.Error:
+            # History is best effort; never lose the forecast over it
+            pass
+    return data
+
+def api_get(endpoint, lat, lon, units='metric', cache=None, priority=PRIORITY_INTERACTIVE,
+            place_name=None):
+    if cache is None:
+        cache = response_cache
+    
+    key = cache.make_key(endpoint, lat, lon, units)
+    data, state = cache.lookup(key, endpoint)
+    
+    if state == 'fresh':
+        return data
+    
+    if state == 'stale':
+        cache.revalidate(key, endpoint, lambda: fetch_payload(
+            endpoint, lat, lon, key, PRIORITY_BACKGROUND, units, place_name))
+        return data
+    
+    data = fetch_payload(endpoint, lat, lon, key, priority, units, place_name)
+    cache.store(key, endpoint, data)
+    return data
+
+class RefreshDaemon:
+    # Keeps the most searched locations warm: every `interval` seconds it
+    # ranks locations by how often they were searched recently and
+    # refetches their weather/forecast shortly before the cached copy stops
+    # being fresh. Refetches are capped at budget_per_minute and run at
+    # background priority, behind interactive and bulk requests.
+    def __init__(self, top_n=200, concurrency=2, budget_per_minute=REFRESH_BUDGET_PER_MINUTE,
+                 lead=120, interval=120, window_days=30, cache=None):
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.lead = lead
+        self.interval = interval
+        self.window_days = window_days
+        self.cache = cache
+        self.budget = TokenBucket(budget_per_minute / 60.0, budget_per_minute)
+        self.cycles = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.over_budget = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='refresh')
+    
+    def hot_locations(self):
+        since = (datetime.now() - timedelta(days=self.window_days)).strftime('%Y-%m-%d %H:%M:%S')
+        return db.query('''SELECT AVG(lat), AVG(lon), COUNT(*) AS searches FROM searches
+                           WHERE timestamp >= ? AND lat IS NOT NULL
+                           GROUP BY ROUND(lat, 2), ROUND(lon, 2)
+                           ORDER BY searches DESC LIMIT ?''', (since, self.top_n))
+    
+    def due(self):
+        # (endpoint, lat, lon, key) for hot entries that are missing or about to go stale
+        cache = self.cache or response_cache
+        now = time.time()
+        jobs = []
+        for lat, lon, _ in self.hot_locations():
+            for endpoint in ('weather', 'forecast'):
+                key = cache.make_key(endpoint, lat, lon)
+                fetched = cache.fetched_at(key)
+                if fetched is None or now - fetched >= cache.fresh.get(endpoint, 0) - self.lead:
+                    jobs.append((endpoint, lat, lon, key))
+        return jobs
+    
+    def refresh(self, endpoint, lat, lon, key):
+        cache = self.cache or response_cache
+        try:
+            data = fetch_payload(endpoint, lat, lon, key, PRIORITY_BACKGROUND)
+            cache.store(key, endpoint, data, prefetched=True)
+            self.refreshed += 1
+        except Exception:
+            self.failed += 1
+    
+    def run_cycle(self):
+        self.cycles += 1
+        futures = []
+        for job in self.due():
+            if self.budget.wait_time() > 0:
+                self.over_budget += 1
+                continue
+            self.budget.take()
+            futures.append(self._pool.submit(self.refresh, *job))
+        wait(futures)
+        return len(futures)
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_cycle()
+            except sqlite3.Error:
+                pass
+            self._stop.wait(self.interval)
+    
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='refresh-daemon', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def stats(self):
+        cache_stats = (self.cache or response_cache).stats()
+        return {
+            'cycles': self.cycles,
+            'refreshed': self.refreshed,
+            'failed': self.failed,
+            'over_budget': self.over_budget,
+            'prefetch_hits': cache_stats['prefetch_hits'],
+            'prefetch_hit_ratio': cache_stats['prefetch_hit_ratio']
         }
+
+def api_key_configured():
+    return API_KEY not in ('', 'YOUR_API_KEY', 'YOUR_API_KEY_HERE')
+
+@timings.timed('get_weather')
+def get_weather(lat, lon, priority=PRIORITY_INTERACTIVE):
+    if not api_key_configured():
+        return None, "Please Add Your API KEY First!!"
+    
+    try:
+        data = api_get('weather', lat, lon, priority=priority)
+        weather = parse_current(data)
         
         return weather, None
     
     except Exception as e:
         return None, f"Error: {str(e)}"
 
-def get_forecast(lat, lon):
-    if API_KEY == "YOUR_API_KEY_HERE":
-        return None, "Please Add Your API KEY First!!"
+class ForecastColumns:
+    # A forecast payload parsed once into typed columns. `time` is UTC and
+    # `offset` the location's UTC offset for that row. Descriptions are
+    # stored as small integer codes into `descriptions`.
+    __slots__ = ('time', 'offset', 'temp', 'humidity', 'wind', 'precip', 'desc', 'descriptions',
+                 'tz_offset', 'location')
     
-    url = "https://api.openweathermap.org/data/2.5/forecast"
+    def __init__(self, tz_offset=0):
+        self.time = array('q')
+        self.offset = array('l')
+        self.temp = array('d')
+        self.humidity = array('d')
+        self.wind = array('d')
+        self.precip = array('d')
+        self.desc = array('l')
+        self.descriptions = []
+        self.tz_offset = tz_offset
+        self.location = array('l')
+    
+    def __len__(self):
+        return len(self.time)
+
+def parse_forecast(data, columns=None, location=0):
+    # Appends one payload to `columns` (a new ForecastColumns by default);
+    # `location` tags the rows so many payloads can be aggregated together.
+    city = data.get('city') or {}
+    if columns is None:
+        columns = ForecastColumns(city.get('timezone', 0))
+    
+    tz_offset = city.get('timezone', columns.tz_offset)
+    codes = {desc: code for code, desc in enumerate(columns.descriptions)}
+    
+    if 'list' not in data:
+        raise PayloadError('forecast', "missing field 'list'")
+    
+    for index, item in enumerate(data['list']):
+        try:
+            main = item['main']
+            dt = item['dt']
+            temp = main['temp']
+            desc = item['weather'][0]['description']
+            precip = ((item.get('rain') or {}).get('3h', 0.0) +
+                      (item.get('snow') or {}).get('3h', 0.0))
+        except (KeyError, IndexError, TypeError) as e:
+            raise PayloadError('forecast', f"entry {index} is missing field {e}")
+        
+        columns.time.append(dt)
+        columns.offset.append(tz_offset)
+        columns.temp.append(temp)
+        columns.humidity.append(main.get('humidity', 0))
+        columns.wind.append((item.get('wind') or {}).get('speed', 0.0))
+        columns.precip.append(precip)
+        
+        code = codes.get(desc)
+        if code is None:
+            code = codes[desc] = len(columns.descriptions)
+            columns.descriptions.append(desc)
+        columns.desc.append(code)
+        columns.location.append(location)
+    
+    return columns
+
+def aggregate_forecast(columns):
+    return aggregate_forecast_batch(columns).get(0, [])
+
+def aggregate_forecast_batch(columns):
+    # Single pass over the columns, grouping by (location, local calendar day).
+    # Returns {location: [day, ...]} with days in time order.
+    groups = {}
+    times, offsets, temps, precips, descs, locations = (
+        columns.time, columns.offset, columns.temp, columns.precip, columns.desc, columns.location)
+    
+    for i in range(len(times)):
+        key = (locations[i], (times[i] + offsets[i]) // 86400)
+        temp = temps[i]
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [temp, temp, temp, 1, precips[i], {descs[i]: 1}]
+            continue
+        
+        if temp > group[0]:
+            group[0] = temp
+        if temp < group[1]:
+            group[1] = temp
+        group[2] += temp
+        group[3] += 1
+        group[4] += precips[i]
+        counts = group[5]
+        counts[descs[i]] = counts.get(descs[i], 0) + 1
+    
+    result = {}
+    for (location, day), (high, low, total, count, precip, counts) in sorted(groups.items()):
+        result.setdefault(location, []).append(ForecastDay(
+            datetime.fromtimestamp(day * 86400, timezone.utc).strftime('%Y-%m-%d'),
+            high,
+            low,
+            total / count,
+            precip,
+            columns.descriptions[max(counts, key=counts.get)]
+        ))
+    return result
+
+@timings.timed('get_forecast')
+def get_forecast(lat, lon, priority=PRIORITY_INTERACTIVE, place_name=None, aggregate=True):
+    if not api_key_configured():
+        return None, "Please Add Your API KEY First!!"
     
     try:
-        response = requests.get(url, params={
-            'lat': lat,
-            'lon': lon,
-            'appid': API_KEY,
-            'units': 'metric'
-        }, timeout=10)
-        
-        data = response.json()
-        
-        days = {}
-        for item in data['list']:
-            date = item['dt_txt'].split(' ')[0]
-            if date not in days:
-                days[date] = {'temps': [], 'desc': []}
-            
-            days[date]['temps'].append(item['main']['temp'])
-            days[date]['desc'].append(item['weather'][0]['description'])
-        
-        forecast = []
-        for date in list(days.keys())[:5]:
-            forecast.append({
-                'date': date,
-                'high': max(days[date]['temps']),
-                'low': min(days[date]['temps']),
-                'desc': max(set(days[date]['desc']), key=days[date]['desc'].count)
-            })
-        
-        return forecast, None
+        data = api_get('forecast', lat, lon, priority=priority, place_name=place_name)
+        if not aggregate:
+            # Fetching records it; callers that never show the daily summary stop there
+            return None, None
+        return aggregate_forecast(parse_forecast(data)), None
         
     except Exception as e:
         return None, f"Error: {str(e)}"
 
+ForecastPoint = namedtuple('ForecastPoint', ['valid_time', 'temp', 'humidity', 'wind', 'description'])
+
+LOCATION_GRID = 0.01
+
+def location_key(lat, lon):
+    return round(round(lat / LOCATION_GRID) * LOCATION_GRID, 4), round(round(lon / LOCATION_GRID) * LOCATION_GRID, 4)
+
+def get_location_id(lat, lon, name=None, create=True):
+    grid_lat, grid_lon = location_key(lat, lon)
+    with db.transaction() as conn:
+        row = conn.execute('SELECT id, name FROM locations WHERE lat=? AND lon=?',
+                           (grid_lat, grid_lon)).fetchone()
+        if row is not None:
+            if name and row[1] != name:
+                conn.execute('UPDATE locations SET name=? WHERE id=?', (name, row[0]))
+            return row[0]
+        if not create:
+            return None
+        return conn.execute('INSERT INTO locations (name, lat, lon) VALUES (?, ?, ?)',
+                            (name, grid_lat, grid_lon)).lastrowid
+
+def record_forecast(lat, lon, columns, place_name=None, fetched=None):
+    # Upserts every 3-hourly point, so refetching the same forecast window
+    # just refreshes the stored values. fetched is when the payload arrived.
+    location_id = get_location_id(lat, lon, place_name)
+    if fetched is None:
+        fetched = int(time.time())
+    descriptions = columns.descriptions
+    rows = [(location_id, columns.time[i], columns.temp[i], int(columns.humidity[i]),
+             columns.wind[i], descriptions[columns.desc[i]], fetched)
+            for i in range(len(columns))]
+    
+    with db.transaction() as conn:
+        conn.executemany('''INSERT INTO forecast_points
+                            (location_id, valid_time, temp, humidity, wind, description, fetched)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT (location_id, valid_time) DO UPDATE SET
+                            temp=excluded.temp, humidity=excluded.humidity, wind=excluded.wind,
+                            description=excluded.description, fetched=excluded.fetched''', rows)
+    return len(rows)
+
+# Where fetch_payload() sends parsed forecasts. Bulk worker processes swap in
+# a function that ships them to the process that owns the database.
+forecast_recorder = record_forecast
+
+def set_forecast_recorder(recorder):
+    global forecast_recorder
+    forecast_recorder = recorder
+
+def get_forecast_history(lat, lon, start, end):
+    # Every stored point for the location between the start and end dates
+    # ('YYYY-MM-DD', inclusive, UTC), answered from the primary key index.
+    location_id = get_location_id(lat, lon, create=False)
+    if location_id is None:
+        return []
+    
+    start_time = int(datetime.strptime(start, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+    end_time = int(datetime.strptime(end, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp()) + 86400
+    
+    rows = db.query('''SELECT valid_time, temp, humidity, wind, description FROM forecast_points
+                       WHERE location_id=? AND valid_time >= ? AND valid_time < ?
+                       ORDER BY valid_time''', (location_id, start_time, end_time))
+    return [ForecastPoint(*row) for row in rows]
+
+DaySummary = namedtuple('DaySummary', ['date', 'temp_min', 'temp_max', 'temp_afternoon',
+                                       'humidity', 'precip', 'wind_max'])
+
+def parse_day_summary(data, date):
+    try:
+        temperature = data['temperature']
+        return DaySummary(date, temperature['min'], temperature['max'],
+                          temperature.get('afternoon'),
+                          (data.get('humidity') or {}).get('afternoon'),
+                          (data.get('precipitation') or {}).get('total', 0.0),
+                          ((data.get('wind') or {}).get('max') or {}).get('speed'))
+    except (KeyError, TypeError) as e:
+        raise PayloadError('day summary', f"missing field {e}")
+
+def fetch_day_summary(lat, lon, date, units='metric'):
+    data = fetch_api('day_summary', lat, lon, units, base=HISTORY_API_BASE, params={'date': date})
+    return parse_day_summary(data, date)
+
+def store_day_summary(location_id, summary):
+    db.execute('''INSERT OR REPLACE INTO weather_history
+                  (location_id, date, temp_min, temp_max, temp_afternoon, humidity, precip,
+                   wind_max, fetched)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+               (location_id,) + tuple(summary) + (int(time.time()),))
+
+def get_history(lat, lon, start, end):
+    # Archived daily summaries for the range (dates inclusive)
+    location_id = get_location_id(lat, lon, create=False)
+    if location_id is None:
+        return []
+    rows = db.query('''SELECT date, temp_min, temp_max, temp_afternoon, humidity, precip, wind_max
+                       FROM weather_history WHERE location_id=? AND date BETWEEN ? AND ?
+                       ORDER BY date''', (location_id, start, end))
+    return [DaySummary(*row) for row in rows]
+
+def backfill_history(lat, lon, start, end, place_name=None, progress=None,
+                     priority=PRIORITY_BULK):
+    # Fetches one day summary per past day in the range, skipping days that
+    # are already archived. Requests go through the scheduler, so they run
+    # concurrently but within the OpenWeatherMap budget. progress(done, total)
+    # is called as days complete.
+    location_id = get_location_id(lat, lon, place_name)
+    first = datetime.strptime(start, '%Y-%m-%d').date()
+    last = min(datetime.strptime(end, '%Y-%m-%d').date(), datetime.now().date() - timedelta(days=1))
+    days = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+    
+    archived = {row[0] for row in db.query(
+        'SELECT date FROM weather_history WHERE location_id=? AND date BETWEEN ? AND ?',
+        (location_id, start, end))}
+    missing = [day for day in days if day not in archived]
+    
+    report = {'days': len(days), 'archived': len(days) - len(missing), 'fetched': 0, 'failed': []}
+    done = report['archived']
+    if progress:
+        progress(done, len(days))
+    
+    grid_lat, grid_lon = location_key(lat, lon)
+    futures = {scheduler.submit('openweathermap', ('day_summary', grid_lat, grid_lon, day),
+                                lambda day=day: fetch_day_summary(lat, lon, day), priority): day
+               for day in missing}
+    
+    for future in as_completed(futures):
+        day = futures[future]
+        try:
+            store_day_summary(location_id, future.result())
+            report['fetched'] += 1
+        except Exception as e:
+            report['failed'].append((day, str(e)))
+        done += 1
+        if progress:
+            progress(done, len(days))
+    
+    return report
+
+@timings.timed('search_weather')
+def search_weather(location, executor, is_stale=None, priority=PRIORITY_INTERACTIVE, forecast_days=True):
+    # Geocode first, then fetch current conditions and the forecast in
+    # parallel. Returns None if is_stale() says the caller no longer cares.
+    # This blocks on the two fetches it submits to executor, so callers
+    # running search_weather itself in a pool give it a separate executor.
+    loc_ok, lat, lon, place_name = check_location(location, priority=priority)
+    
+    if is_stale and is_stale():
+        return None
+    
+    result = {'error': None, 'place_name': place_name, 'lat': lat, 'lon': lon,
+              'weather': None, 'forecast': None, 'forecast_error': None}
+    
+    if not loc_ok:
+        result['error'] = place_name
+        return result
+    
+    weather_future = executor.submit(get_weather, lat, lon, priority)
+    forecast_future = executor.submit(get_forecast, lat, lon, priority, place_name, forecast_days)
+    
+    weather, error = weather_future.result()
+    if error:
+        forecast_future.cancel()
+        result['error'] = error
+        return result
+    
+    result['weather'] = weather
+    result['forecast'], result['forecast_error'] = forecast_future.result()
+    
+    if is_stale and is_stale():
+        return None
+    return result
+
+EXPORT_CHUNK = 5000
+
+def iter_searches(chunk_size=EXPORT_CHUNK):
+    # Walks the history in keyset pages so exports run in constant memory and
+    # never hold the database lock for longer than one page.
+    after = None
+    while True:
+        rows = get_searches_page(after, chunk_size)
+        yield from rows
+        
+        if len(rows) < chunk_size:
+            return
+        after = (rows[-1].timestamp, rows[-1].id)
+
+EXPORT_KEYS = ('id', 'location', 'lat', 'lon', 'start_date', 'end_date', 'temp',
+               'feels_like', 'humidity', 'description', 'wind_speed', 'timestamp')
+
+def row_to_dict(row):
+    return dict(zip(EXPORT_KEYS, row))
+
+@timings.timed('export_json')
 def export_json(data, filename):
+    # Same layout as json.dump(list, indent=2), written one record at a time.
+    # Only the scalar values go through the encoder, which keeps it on the
+    # C fast path instead of the pure-Python indenting encoder.
+    import json
+    dumps = json.dumps
+    keys = [f'"{key}": ' for key in EXPORT_KEYS]
     with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
+        sep = '[\n  '
+        for row in data:
+            f.write(sep)
+            f.write('{\n    ' + ',\n    '.join([key + dumps(value) for key, value in zip(keys, row)]) + '\n  }')
+            sep = ',\n  '
+        
+        f.write('[]' if sep == '[\n  ' else '\n]')
 
+@timings.timed('export_csv')
 def export_csv(data, filename):
-    if not data:
+    import csv
+    rows = iter(data)
+    first = next(rows, None)
+    if first is None:
         return
     
     with open(filename, 'w', newline='') as f:
         writer = csv.writer(f)
         writer.writerow(['ID', 'Location', 'Start Date', 'End Date', 'Temperature', 
                         'Humidity', 'Description', 'Timestamp'])
-        for row in data:
-            writer.writerow(row)
+        writer.writerow(first)
+        writer.writerows(rows)
 
+@timings.timed('export_xml')
 def export_xml(data, filename):
-    xml = '<?xml version="1.0"?>\n<searches>\n'
-    
-    for row in data:
-        xml += '  <search>\n'
-        xml += f'    <id>{row[0]}</id>\n'
-        xml += f'    <location>{row[1]}</location>\n'
-        xml += f'    <start_date>{row[4]}</start_date>\n'
-        xml += f'    <end_date>{row[5]}</end_date>\n'
-        xml += f'    <temperature>{row[6]}</temperature>\n'
-        xml += f'    <humidity>{row[8]}</humidity>\n'
-        xml += f'    <description>{row[9]}</description>\n'
-        xml += f'    <timestamp>{row[11]}</timestamp>\n'
-        xml += '  </search>\n'
-    
-    xml += '</searches>'
-    
-    with open(filename, 'w') as f:
-        f.write(xml)
+    from xml.sax.saxutils import escape as xml_escape
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<searches>\n')
+        
+        for row in data:
+            f.write(
+                '  <search>\n'
+                f'    <id>{row.id}</id>\n'
+                f'    <location>{xml_escape(str(row.location))}</location>\n'
+                f'    <start_date>{xml_escape(str(row.start_date))}</start_date>\n'
+                f'    <end_date>{xml_escape(str(row.end_date))}</end_date>\n'
+                f'    <temperature>{row.temp}</temperature>\n'
+                f'    <humidity>{row.humidity}</humidity>\n'
+                f'    <description>{xml_escape(str(row.weather_desc))}</description>\n'
+                f'    <timestamp>{xml_escape(str(row.timestamp))}</timestamp>\n'
+                '  </search>\n'
+            )
+        
+        f.write('</searches>')
 
+@timings.timed('export_md')
 def export_markdown(data, filename):
-    md = '# Weather Search History\n\n'
-    
-    for row in data:
-        md += f'## Search #{row[0]}\n\n'
-        md += f'**Location:** {row[1]}\n\n'
-        md += f'**Date Range:** {row[4]} to {row[5]}\n\n'
-        md += f'**Temperature:** {row[6]}°C\n\n'
-        md += f'**Humidity:** {row[8]}%\n\n'
-        md += f'**Weather:** {row[9]}\n\n'
-        md += f'**Saved:** {row[11]}\n\n'
-        md += '---\n\n'
-    
     with open(filename, 'w') as f:
-        f.write(md)
+        f.write('# Weather Search History\n\n')
+        
+        for row in data:
+            f.write(
+                f'## Search #{row.id}\n\n'
+                f'**Location:** {row.location}\n\n'
+                f'**Date Range:** {row.start_date} to {row.end_date}\n\n'
+                f'**Temperature:** {row.temp}°C\n\n'
+                f'**Humidity:** {row.humidity}%\n\n'
+                f'**Weather:** {row.weather_desc}\n\n'
+                f'**Saved:** {row.timestamp}\n\n'
+                '---\n\n'
+            )
+
+EXPORTERS = {
+    'json': export_json,
+    'csv': export_csv,
+    'xml': export_xml,
+    'md': export_markdown
+}
+
+def export_searches(format_type, filename):
+    EXPORTERS[format_type](iter_searches(), filename)
+
+def retention_cutoff(max_age_days=None, max_rows=None):
+    # The (timestamp, id) key below which rows are due for archiving, or
+    # None if neither limit applies. With both, the stricter one wins.
+    cutoffs = []
+    if max_age_days is not None:
+        oldest = datetime.now() - timedelta(days=max_age_days)
+        cutoffs.append((oldest.strftime('%Y-%m-%d %H:%M:%S'), 0))
+    if max_rows is not None:
+        # The newest row that no longer fits in the limit, and all below it
+        rows = db.query('''SELECT timestamp, id FROM searches
+                           ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?''', (max(0, max_rows),))
+        if rows:
+            cutoffs.append((rows[0][0], rows[0][1] + 1))
+    return max(cutoffs) if cutoffs else None
+
+def archive_path(month, archive_dir=None):
+    return os.path.join(archive_dir or ARCHIVE_DIR, f'searches-{month}.jsonl.gz')
+
+def write_archive(rows, archive_dir=None):
+    # Appends rows to their month's gzip file (one gzip member per call, which
+    # gzip readers treat as one stream) and syncs it before returning
+    import gzip
+    import json
+    
+    months = {}
+    for row in rows:
+        months.setdefault((row.timestamp or 'unknown')[:7], []).append(row)
+    
+    os.makedirs(archive_dir or ARCHIVE_DIR, exist_ok=True)
+    for month, month_rows in months.items():
+        with open(archive_path(month, archive_dir), 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+                f.write(''.join(json.dumps(list(row), separators=(',', ':')) + '\n'
+                                for row in month_rows).encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+    return sorted(months)
+
+def apply_retention(max_age_days=None, max_rows=None, archive_dir=None, batch_size=None,
+                    pause=0.01, dry_run=False):
+    # Moves rows past the age/row-count limits (None turns one off) into the
+    # monthly archives, one short transaction per batch so the GUI and the
+    # writer get turns in between. Rows are written to the archive before
+    # they are deleted; if a run dies in between, the archive readers skip
+    # the repeated ids. archive_dir and batch_size default to ARCHIVE_DIR
+    # and RETENTION_BATCH as they are at call time.
+    batch_size = batch_size or RETENTION_BATCH
+    report = {'archived': 0, 'partitions': [], 'cutoff': None}
+    cutoff = retention_cutoff(max_age_days, max_rows)
+    if cutoff is None:
+        return report
+    report['cutoff'] = cutoff
+    
+    if dry_run:
+        report['archived'] = db.query('SELECT count(*) FROM searches WHERE (timestamp, id) < (?, ?)',
+                                      cutoff)[0][0]
+        return report
+    
+    search_writer.flush()
+    partitions = set()
+    while True:
+        rows = db.query(f'''SELECT {SEARCH_COLUMNS} FROM searches WHERE (timestamp, id) < (?, ?)
+                            ORDER BY timestamp, id LIMIT ?''', (*cutoff, batch_size), search_record_factory)
+        if not rows:
+            break
+        
+        partitions.update(write_archive(rows, archive_dir))
+        with db.transaction() as conn:
+            # Archived rows stay counted in the rollups
+            conn.execute('INSERT INTO archiving (flag) VALUES (1)')
+            conn.executemany('DELETE FROM searches WHERE id=?', [(row.id,) for row in rows])
+            conn.execute('DELETE FROM archiving')
+        report['archived'] += len(rows)
+        time.sleep(pause)
+    
+    report['partitions'] = sorted(partitions)
+    return report
+
+def archived_partitions(archive_dir=None):
+    archive_dir = archive_dir or ARCHIVE_DIR
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(match.group(1) for match in
+                  map(re.compile(r'searches-(.+)\.jsonl\.gz$').match, os.listdir(archive_dir)) if match)
+
+def iter_archived(start=None, end=None, location=None, archive_dir=None):
+    # Archived rows as SearchRecords, oldest month first. start/end are
+    # 'YYYY-MM-DD' days (inclusive) and only the matching month files are
+    # opened; location is a case-insensitive substring match.
+    import gzip
+    import json
+    
+    needle = location.lower() if location else None
+    for month in archived_partitions(archive_dir):
+        if (start and month < start[:7]) or (end and month > end[:7]):
+            continue
+        
+        seen = set()
+        with gzip.open(archive_path(month, archive_dir), 'rt', encoding='utf-8') as f:
+            for line in f:
+                row = SearchRecord(*json.loads(line))
+                if row.id in seen:
+                    continue
+                seen.add(row.id)
+                
+                day = (row.timestamp or '')[:10]
+                if (start and day < start) or (end and day > end):
+                    continue
+                if needle and needle not in (row.location or '').lower():
+                    continue
+                yield row
+
+def export_archive(format_type, filename, start=None, end=None, location=None, archive_dir=None):
+    EXPORTERS[format_type](iter_archived(start, end, location, archive_dir), filename)
+
+def enable_incremental_vacuum():
+    # auto_vacuum can only change on an empty file or through a full VACUUM,
+    # so an existing database is rewritten once here (and locked meanwhile)
+    with db.transaction() as conn:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            return False
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    return True
+
+def compact(step_pages=None, pause=0.05, max_seconds=None):
+    # Returns free pages to the filesystem a few at a time, each step its own
+    # short write, then truncates the WAL. Returns the pages released, or
+    # None if the database isn't in incremental auto_vacuum mode.
+    if db.query('PRAGMA auto_vacuum')[0][0] != 2:
+        return None
+    
+    step_pages = step_pages or COMPACT_STEP_PAGES
+    released = 0
+    started = time.monotonic()
+    while True:
+        with db.transaction() as conn:
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free:
+                break
+            # executescript steps the pragma to completion; execute() would
+            # stop after the first page
+            conn.executescript(f'PRAGMA incremental_vacuum({step_pages})')
+            released += free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        
+        if max_seconds is not None and time.monotonic() - started >= max_seconds:
+            break
+        time.sleep(pause)
+    
+    db.query('PRAGMA wal_checkpoint(TRUNCATE)')
+    return released
 
 class WeatherApp:
     def __init__(self, root):
@@ -255,11 +2308,52 @@ class WeatherApp:
         self.root.title("Weather App")
         self.root.geometry("1000x700")
         
-        setup_database()
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='weather')
+        self.search_seq = 0
+        self.refresher = RefreshDaemon(budget_per_minute=REFRESH_BUDGET_PER_MINUTE)
         
         self.setup_gui()
         
-        self.refresh_table()
+        # Paint the window first: the schema check and the first page of
+        # history load in the background and fill the table when ready
+        self.db_ready = threading.Event()
+        self.table_page_pending = True
+        self.notebook.tab(self.db_tab, text='Saved Searches (loading)')
+        threading.Thread(target=self.load_history, daemon=True).start()
+    
+    def load_history(self):
+        try:
+            setup_database()
+            rows = get_searches_page()
+            error = None
+        except Exception as e:
+            rows, error = [], str(e)
+        
+        self.db_ready.set()
+        if error is None and REFRESH_ENABLED and api_key_configured():
+            self.refresher.start()
+        self.root.after(0, self.show_history_page, rows, error)
+        
+        # Warm the network stack now so the first search doesn't pay for it
+        load_network()
+        
+        # Retention runs in the background, in short batches, once the
+        # window is usable; it does nothing unless a limit is configured
+        if error is None and (RETENTION_MAX_AGE_DAYS is not None or RETENTION_MAX_ROWS is not None):
+            try:
+                if apply_retention(RETENTION_MAX_AGE_DAYS, RETENTION_MAX_ROWS)['archived']:
+                    compact(max_seconds=5)
+            except (OSError, sqlite3.Error):
+                pass
+    
+    def show_history_page(self, rows, error):
+        self.notebook.tab(self.db_tab, text='Saved Searches')
+        self.table_page_pending = False
+        if error:
+            messagebox.showerror("Error", f"Could not load saved searches: {error}")
+            return
+        
+        self.add_table_page(rows)
     
     def setup_gui(self):
         header = tk.Frame(self.root, bg='#4a90e2', height = 80)
@@ -343,13 +2437,42 @@ class WeatherApp:
         tk.Button(btn_frame, text="MD", command=lambda: self.do_export('md'),
                  bg='#17a2b8', fg='white').pack(side='left', padx=2)
         
+        filter_frame = tk.Frame(self.db_tab)
+        filter_frame.pack(fill='x', padx=10, pady=2)
+        self.table_filter = None
+        
+        tk.Label(filter_frame, text="Find:").pack(side='left')
+        self.filter_text = tk.Entry(filter_frame, width=20)
+        self.filter_text.pack(side='left', padx=2)
+        self.filter_text.bind('<Return>', lambda event: self.apply_filter())
+        
+        tk.Label(filter_frame, text="Near:").pack(side='left', padx=(10, 0))
+        self.filter_near = tk.Entry(filter_frame, width=20)
+        self.filter_near.pack(side='left', padx=2)
+        self.filter_near.bind('<Return>', lambda event: self.apply_filter())
+        
+        tk.Label(filter_frame, text="within (km):").pack(side='left', padx=(10, 0))
+        self.filter_radius = tk.Entry(filter_frame, width=6)
+        self.filter_radius.pack(side='left', padx=2)
+        self.filter_radius.insert(0, "50")
+        
+        tk.Button(filter_frame, text="Filter", command=self.apply_filter,
+                 bg='#4a90e2', fg='white').pack(side='left', padx=2)
+        
+        tk.Button(filter_frame, text="Clear", command=self.clear_filter,
+                 bg='#6c757d', fg='white').pack(side='left', padx=2)
+        
         table_frame = tk.Frame(self.db_tab)
         table_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
         scroll = tk.Scrollbar(table_frame)
         scroll.pack(side='right', fill='y')
+        self.table_scroll = scroll
+        self.table_cursor = None
+        self.table_exhausted = False
+        self.table_page_pending = False
         
-        self.table = ttk.Treeview(table_frame, yscrollcommand=scroll.set,
+        self.table = ttk.Treeview(table_frame, yscrollcommand=self.on_table_scroll,
                                   columns=('ID', 'Location', 'Dates', 'Temp', 'Weather', 'Time'),
                                   show='headings')
         
@@ -370,6 +2493,30 @@ class WeatherApp:
         self.table.pack(side='left', fill='both', expand=True)
         scroll.config(command=self.table.yview)
         
+        self.diag_tab = tk.Frame(self.notebook)
+        self.notebook.add(self.diag_tab, text='Diagnostics')
+        
+        diag_frame = tk.Frame(self.diag_tab)
+        diag_frame.pack(fill='x', padx=10, pady=5)
+        
+        self.timings_enabled = tk.BooleanVar(value=timings.enabled)
+        tk.Checkbutton(diag_frame, text="Record timings", variable=self.timings_enabled,
+                       command=self.toggle_timings).pack(side='left', padx=2)
+        
+        tk.Button(diag_frame, text="Refresh", command=self.refresh_diagnostics,
+                 bg='#28a745', fg='white').pack(side='left', padx=2)
+        
+        tk.Button(diag_frame, text="Reset", command=self.reset_timings,
+                 bg='#dc3545', fg='white').pack(side='left', padx=2)
+        
+        tk.Button(diag_frame, text="Save", command=self.save_timings,
+                 bg='#17a2b8', fg='white').pack(side='left', padx=2)
+        
+        self.diag_display = tk.Text(self.diag_tab, font=('Courier', 10),
+                                    wrap='none', height=12)
+        self.diag_display.pack(fill='both', expand=True, padx=10, pady=10)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        
         tk.Button(self.root, text="About PM Accelerator", 
                  command=self.show_about,
                  bg='#6c757d', fg='white').pack(pady=5)
@@ -391,27 +2538,84 @@ class WeatherApp:
             messagebox.showerror("Error", date_msg)
             return
         
+        # A new click supersedes whatever search is still in flight
+        self.search_seq += 1
+        seq = self.search_seq
+        
         self.current_display.delete('1.0', tk.END)
         self.current_display.insert('1.0', "Searching...\n")
-        self.root.update()
         
-        loc_ok, lat, lon, place_name = check_location(location)
+        def is_stale():
+            return seq != self.search_seq
         
-        if not loc_ok:
-            self.current_display.delete('1.0', tk.END)
-            self.current_display.insert('1.0', f"Error: {place_name}\n")
+        def worker():
+            result = search_weather(location, self.executor, is_stale)
+            if result is None:
+                return
+            
+            if not result['error']:
+                weather = result['weather']
+                try:
+                    self.db_ready.wait()
+                    result['saved_id'] = save_to_db(result['place_name'], result['lat'], result['lon'],
+                                                    start, end, weather.temp, weather.feels_like,
+                                                    weather.humidity, weather.description,
+                                                    weather.wind)
+                except Exception as e:
+                    result['save_error'] = str(e)
+            
+            self.root.after(0, self.show_search_result, seq, result, start, end)
+            
+            # Past dates: fill in what the weather actually was on those days
+            if not result['error'] and start < datetime.now().strftime('%Y-%m-%d'):
+                def progress(done, total):
+                    self.root.after(0, self.show_history_progress, seq, done, total)
+                
+                report = backfill_history(result['lat'], result['lon'], start, end,
+                                          result['place_name'], progress, PRIORITY_INTERACTIVE)
+                history = get_history(result['lat'], result['lon'], start, end)
+                self.root.after(0, self.show_history, seq, history, report)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def show_history_progress(self, seq, done, total):
+        if seq != self.search_seq or not total:
+            return
+        self.notebook.tab(self.forecast_tab, text=f'5-Day Forecast (past days {done}/{total})')
+    
+    def show_history(self, seq, history, report):
+        if seq != self.search_seq:
             return
         
-        self.current_display.insert(tk.END, "Getting weather data...\n")
-        self.root.update()
+        self.notebook.tab(self.forecast_tab, text='5-Day Forecast')
+        text = "\nPAST WEATHER\n" + "="*50 + "\n\n"
         
-        weather, error = get_weather(lat, lon)
+        for day in history:
+            text += f"Date: {day.date}\n"
+            text += f"  High: {day.temp_max:.1f}°C | Low: {day.temp_min:.1f}°C\n"
+            text += f"  Precipitation: {day.precip or 0:.1f} mm\n\n"
         
-        if error:
+        if report['failed']:
+            text += f"Could not fetch {len(report['failed'])} day(s): {report['failed'][0][1]}\n"
+        
+        self.forecast_display.insert(tk.END, text)
+    
+    def show_search_result(self, seq, result, start, end):
+        if seq != self.search_seq:
+            return
+        
+        if result['error']:
             self.current_display.delete('1.0', tk.END)
-            self.current_display.insert('1.0', f"Error: {error}\n")
+            self.current_display.insert('1.0', f"Error: {result['error']}\n")
             return
         
+        place_name = result['place_name']
+        lat = result['lat']
+        lon = result['lon']
+        weather = result['weather']
+        forecast = result['forecast']
+        
+        self.current_display.delete('1.0', tk.END)
         text = f"""
 CURRENT WEATHER
 {'='*50}
@@ -419,56 +2623,139 @@ CURRENT WEATHER
 Location: {place_name}
 Coordinates: {lat:.4f}, {lon:.4f}
 
-Temperature: {weather['temp']}°C
-Feels Like: {weather['feels_like']}°C
-Weather: {weather['description']}
-Humidity: {weather['humidity']}%
-Wind Speed: {weather['wind']} m/s
-Pressure: {weather['pressure']} hPa
+Temperature: {weather.temp}°C
+Feels Like: {weather.feels_like}°C
+Weather: {weather.description}
+Humidity: {weather.humidity}%
+Wind Speed: {weather.wind} m/s
+Pressure: {weather.pressure} hPa
 
 Date Range: {start} to {end}
 """
         self.current_display.insert('1.0', text)
         
-        forecast, error = get_forecast(lat, lon)
-        
-        if not error:
+        if forecast:
             self.forecast_display.delete('1.0', tk.END)
             text = "\n5-DAY FORECAST\n" + "="*50 + "\n\n"
             
             for day in forecast:
-                text += f"Date: {day['date']}\n"
-                text += f"  High: {day['high']:.1f}°C | Low: {day['low']:.1f}°C\n"
-                text += f"  {day['desc']}\n\n"
+                text += f"Date: {day.date}\n"
+                text += f"  High: {day.high:.1f}°C | Low: {day.low:.1f}°C | Mean: {day.mean:.1f}°C\n"
+                text += f"  Precipitation: {day.precip:.1f} mm\n"
+                text += f"  {day.desc}\n\n"
             
             self.forecast_display.insert('1.0', text)
         
-        try:
-            save_to_db(place_name, lat, lon, start, end, 
-                      weather['temp'], weather['feels_like'], weather['humidity'],
-                      weather['description'], weather['wind'])
-            
+        if result.get('save_error'):
+            messagebox.showerror("Error", f"Failed to save: {result['save_error']}")
+        else:
             self.current_display.insert(tk.END, "\nSaved to database!\n")
-            self.refresh_table()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save: {str(e)}")
+            self.insert_table_row(result['saved_id'])
+    
+    def table_values(self, row):
+        return (
+            row.id,  
+            row.location[:25],  
+            f"{row.start_date} to {row.end_date}",  
+            f"{row.temp}",  
+            row.weather_desc,  
+            row.timestamp  
+        )
     
+    @timings.timed('refresh_table')
     def refresh_table(self):
-        for item in self.table.get_children():
-            self.table.delete(item)
+        if not self.db_ready.is_set():
+            return
         
-        rows = get_all_searches()
+        self.table.delete(*self.table.get_children())
+        self.table_cursor = None
+        self.table_exhausted = False
+        self.load_table_page()
+    
+    def load_table_page(self):
+        self.table_page_pending = False
+        if self.table_exhausted:
+            return
         
+        if self.table_filter:
+            rows = find_searches(before=self.table_cursor, **self.table_filter)
+        else:
+            rows = get_searches_page(self.table_cursor)
+        self.add_table_page(rows)
+    
+    def add_table_page(self, rows):
         for row in rows:
-            self.table.insert('', 'end', values=(
-                row[0],  
-                row[1][:25],  
-                f"{row[4]} to {row[5]}",  
-                f"{row[6]}",  
-                row[9],  
-                row[11]  
-            ))
+            if not self.table.exists(row.id):
+                self.table.insert('', 'end', iid=row.id, values=self.table_values(row))
+        
+        if rows:
+            # Filtered results page by id, the full history by (timestamp, id)
+            self.table_cursor = rows[-1].id if self.table_filter else (rows[-1].timestamp, rows[-1].id)
+        if len(rows) < PAGE_SIZE:
+            self.table_exhausted = True
+    
+    def on_table_scroll(self, first, last):
+        self.table_scroll.set(first, last)
+        # Fetch the next page once the user gets near the bottom
+        if float(last) > 0.9 and not self.table_exhausted and not self.table_page_pending:
+            self.table_page_pending = True
+            self.root.after_idle(self.load_table_page)
+    
+    def apply_filter(self):
+        text = self.filter_text.get().strip()
+        near = self.filter_near.get().strip()
+        if not text and not near:
+            self.clear_filter()
+            return
+        
+        radius = None
+        if near:
+            try:
+                radius = float(self.filter_radius.get())
+                if radius <= 0:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Error", "Distance must be a positive number of km")
+                return
+        
+        # "Near" may need the geocoder, so resolve it off the Tk thread
+        def worker():
+            table_filter = {'text': text or None}
+            if near:
+                valid, lat, lon, place = check_location(near)
+                if not valid:
+                    self.root.after(0, lambda: messagebox.showerror("Error", f"Near: {place}"))
+                    return
+                table_filter.update(lat=lat, lon=lon, radius_km=radius)
+            self.root.after(0, self.set_table_filter, table_filter)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def set_table_filter(self, table_filter):
+        self.table_filter = table_filter
+        self.refresh_table()
+    
+    def clear_filter(self):
+        self.filter_text.delete(0, tk.END)
+        self.filter_near.delete(0, tk.END)
+        self.set_table_filter(None)
+    
+    def insert_table_row(self, search_id):
+        if self.table_filter:
+            return
+        
+        row = get_search(search_id)
+        if row is not None and not self.table.exists(row.id):
+            self.table.insert('', 0, iid=row.id, values=self.table_values(row))
+    
+    def update_table_row(self, search_id):
+        row = get_search(search_id)
+        if row is not None and self.table.exists(row.id):
+            self.table.item(row.id, values=self.table_values(row))
+    
+    def remove_table_row(self, search_id):
+        if self.table.exists(search_id):
+            self.table.delete(search_id)
     
     def edit_selected(self):
         selected = self.table.selection()
@@ -521,7 +2808,7 @@ Date Range: {start} to {end}
             update_search(search_id, new_loc, new_start, new_end)
             messagebox.showinfo("Success", "Record updated!")
             edit_win.destroy()
-            self.refresh_table()
+            self.update_table_row(search_id)
         
         tk.Button(edit_win, text="Save Changes", command=save_edit,
                  bg='#28a745', fg='white', font=('Arial', 10, 'bold')).pack(pady=10)
@@ -539,12 +2826,10 @@ Date Range: {start} to {end}
         if messagebox.askyesno("Confirm", f"Delete search for '{location}'?"):
             delete_search(search_id)
             messagebox.showinfo("Success", "Record deleted!")
-            self.refresh_table()
+            self.remove_table_row(search_id)
     
     def do_export(self, format_type):
-        data = get_all_searches()
-        
-        if not data:
+        if not get_searches_page(limit=1):
             messagebox.showwarning("Warning", "No data to export")
             return
         
@@ -564,31 +2849,45 @@ Date Range: {start} to {end}
             return
         
         try:
-            if format_type == 'json':
-                json_data = []
-                for row in data:
-                    json_data.append({
-                        'id': row[0], 'location': row[1], 'lat': row[2], 'lon': row[3],
-                        'start_date': row[4], 'end_date': row[5], 'temp': row[6],
-                        'feels_like': row[7], 'humidity': row[8], 'description': row[9],
-                        'wind_speed': row[10], 'timestamp': row[11]
-                    })
-                export_json(json_data, filename)
-            
-            elif format_type == 'csv':
-                export_csv(data, filename)
-            
-            elif format_type == 'xml':
-                export_xml(data, filename)
-            
-            elif format_type == 'md':
-                export_markdown(data, filename)
+            export_searches(format_type, filename)
             
             messagebox.showinfo("Success", f"Exported to:\n{filename}")
         
         except Exception as e:
             messagebox.showerror("Error", f"Export failed: {str(e)}")
     
+    def on_tab_changed(self, event):
+        if self.notebook.select() == str(self.diag_tab):
+            self.refresh_diagnostics()
+    
+    def refresh_diagnostics(self):
+        self.diag_display.delete('1.0', tk.END)
+        self.diag_display.insert('1.0', timings.report() + '\n')
+    
+    def toggle_timings(self):
+        timings.enabled = self.timings_enabled.get()
+        self.refresh_diagnostics()
+    
+    def reset_timings(self):
+        timings.reset()
+        self.refresh_diagnostics()
+    
+    def save_timings(self):
+        filename = filedialog.asksaveasfilename(
+            defaultextension='.txt',
+            filetypes=[('Text files', '*.txt'), ('JSON files', '*.json')]
+        )
+        
+        if not filename:
+            return
+        
+        try:
+            timings.dump(filename)
+            messagebox.showinfo("Success", f"Timings saved to:\n{filename}")
+        
+        except Exception as e:
+            messagebox.showerror("Error", f"Save failed: {str(e)}")
+    
     def show_about(self):
         about_win = tk.Toplevel(self.root)
         about_win.title("About PM Accelerator")
@@ -617,10 +2916,30 @@ LinkedIn: linkedin.com/company/productmanageraccelerator
         text.insert('1.0', info)
         text.config(state='disabled')
 
-if __name__ == '__main__':
+def load_network():
+    global requests, HTTPAdapter, Retry, Nominatim, GeocoderRateLimited
+    if requests is not None:
+        return
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    from geopy.geocoders import Nominatim
+    from geopy.exc import GeocoderRateLimited
+    # Assigned last: other threads skip the imports once this is set
+    import requests
+
+def load_tkinter():
+    global tk, ttk, messagebox, filedialog
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+
+def main():
+    load_tkinter()
     root = tk.Tk()
     app = WeatherApp(root)
     root.mainloop()
+
+if __name__ == '__main__':
+    main()
     
     
     